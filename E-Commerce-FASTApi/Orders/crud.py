@@ -1,11 +1,30 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, or_, select
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from typing import List, Optional
+from datetime import datetime, timedelta
+import os
+import time
  
-from Orders.models import Cart, CartItem, Order, OrderStatus
+from Orders.models import Cart, CartItem, Order, OrderStatus, utc_now
 from Orders.schemas import CartCreate, CartItemCreate, OrderCreate
 from Products import crud as Products_crud  # << central change: use crud instead of routes
  
+CART_RESERVATION_TTL_MINUTES = int(os.getenv("CART_RESERVATION_TTL_MINUTES", "30"))
+CART_SWEEP_BATCH_SIZE = int(os.getenv("CART_SWEEP_BATCH_SIZE", "500"))
+# reserved_until of items kept after their stock was sold (generated or migrated history); never swept or merged into
+RESERVATION_SOLD = datetime(9999, 12, 31)
+# Items still holding reserved stock; a NULL reserved_until holds it without expiring
+LIVE_ITEM = or_(CartItem.reserved_until.is_(None), CartItem.reserved_until < RESERVATION_SOLD)
+
+# Last sweeper pass and running totals, served by /metrics/reservation-sweeper
+reservation_sweep_stats = {"last_pass": None, "passes": 0, "items_released": 0, "units_released": 0}
+
+def reservation_expiry() -> datetime:
+    # Stored as naive UTC like the other timestamps
+    return (utc_now() + timedelta(minutes=CART_RESERVATION_TTL_MINUTES)).replace(tzinfo=None)
+ 
 # ---------------------- CART OPERATIONS ----------------------
  
 def create_cart(db: Session, cart_in: CartCreate) -> Cart:
@@ -31,33 +50,55 @@ def get_user_cart(user_id: int) -> List[CartItem]:
     return cart.items
  
 def add_item(db: Session, cart_id: int, item_in: CartItemCreate) -> CartItem:
+    cart = get_cart(db, cart_id)
+    product = Products_crud.get_product_by_id(db, item_in.product_id)
+    if not product:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Product {item_in.product_id} not found")
+ 
     # Reserve stock before adding
     Products_crud.reserve_products(
-        reservations={"product_id": item_in.id, "quantity": item_in.quantity},
+        reservations={"product_id": item_in.product_id, "quantity": item_in.quantity},
         cart_id=f"cart_{cart_id}",
         db=db
     )
  
-    item = db.query(CartItem).filter_by(cart_id=cart_id, product_id=item_in.id).first()
+    item = db.query(CartItem).filter_by(cart_id=cart_id, product_id=item_in.product_id).filter(LIVE_ITEM).first()
     if item:
         item.quantity += item_in.quantity
     else:
-        item = CartItem(cart_id=cart_id, **item_in.dict())
+        item = CartItem(cart_id=cart_id, user_id=cart.user_id, price=float(product.price), **item_in.model_dump())
         db.add(item)
+    item.reserved_until = reservation_expiry()
  
     db.commit()
     db.refresh(item)
     return item
  
+async def add_item_async(db: AsyncSession, cart_id: int, item_in: CartItemCreate) -> CartItem:
+    # run_sync drives the sync ORM logic over the async connection, off the threadpool
+    return await db.run_sync(add_item, cart_id, item_in)
+ 
 def list_cart_items(db: Session, cart_id: int) -> List[CartItem]:
     cart = get_cart(db, cart_id)
     return cart.items
  
+async def list_cart_items_async(db: AsyncSession, cart_id: int) -> List[CartItem]:
+    result = await db.execute(
+        select(Cart).where(Cart.cart_id == cart_id).options(selectinload(Cart.items))
+    )
+    cart = result.scalar_one_or_none()
+    if not cart:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Cart {cart_id} not found")
+    return cart.items
+ 
+async def get_user_cart_id_async(db: AsyncSession, user_id: int) -> Optional[int]:
+    return await db.scalar(select(Cart.cart_id).where(Cart.user_id == user_id).limit(1))
+ 
 def update_item_quantity(db: Session, cart_id: int, id: int, quantity: int) -> CartItem:
     if quantity < 0:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Quantity must be >= 0")
  
-    item = db.query(CartItem).filter_by(cart_id=cart_id, product_id=id).first()
+    item = db.query(CartItem).filter_by(cart_id=cart_id, product_id=id).filter(LIVE_ITEM).first()
     if not item:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Item not found in cart")
  
@@ -83,6 +124,7 @@ def update_item_quantity(db: Session, cart_id: int, id: int, quantity: int) -> C
         return item
  
     item.quantity = quantity
+    item.reserved_until = reservation_expiry()
     db.commit()
     db.refresh(item)
     return item
@@ -112,6 +154,52 @@ def clear_cart(db: Session, cart_id: int):
         db.delete(item)
     db.commit()
  
+def release_expired_reservations(db: Session, batch_size: int = CART_SWEEP_BATCH_SIZE) -> dict:
+    """Drop cart items whose reservation ran out and give their stock back, one batch per transaction.
+
+    Each batch is one indexed range read on reserved_until, one DELETE, and one
+    release_products call covering every item in it. Rows locked by a concurrent
+    cart update are skipped and picked up on the next pass. Items without a
+    reserved_until aren't expiring reservations and are never released here, and
+    only units that release_products actually moved back count as released.
+    """
+    started = time.perf_counter()
+    now = utc_now().replace(tzinfo=None)
+    batches = items_released = units_released = 0
+    while True:
+        rows = db.execute(
+            select(CartItem.item_id, CartItem.product_id, CartItem.quantity)
+            .where(CartItem.reserved_until < now)
+            .order_by(CartItem.reserved_until)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            break
+        db.execute(delete(CartItem).where(CartItem.item_id.in_([row.item_id for row in rows])))
+        # Commits the delete together with the release
+        released = Products_crud.release_products(
+            reservations=[{"product_id": row.product_id, "quantity": row.quantity} for row in rows],
+            cart_id="expired",
+            db=db
+        )
+        batches += 1
+        items_released += len(rows)
+        units_released += sum(item["quantity"] for item in released["released_items"])
+
+    result = {
+        "batches": batches,
+        "items_released": items_released,
+        "units_released": units_released,
+        "seconds": round(time.perf_counter() - started, 3),
+        "started_at": now.isoformat()
+    }
+    reservation_sweep_stats["last_pass"] = result
+    reservation_sweep_stats["passes"] += 1
+    reservation_sweep_stats["items_released"] += items_released
+    reservation_sweep_stats["units_released"] += units_released
+    return result
+ 
 # ---------------------- ORDER OPERATIONS ----------------------
  
 def create_order(db: Session, order_in: OrderCreate) -> Order:
@@ -130,12 +218,29 @@ def create_order(db: Session, order_in: OrderCreate) -> Order:
  
     try:
         reservations = [
-            {"product_id": item.id, "quantity": item.quantity}
+            {"product_id": item.product_id, "quantity": item.quantity}
             for item in order_in.items
         ]
+        # The bought units leave the cart, so the expiry sweeper can't hand sold stock back
+        bought = {}
+        for item in order_in.items:
+            bought[item.product_id] = bought.get(item.product_id, 0) + item.quantity
+        cart_items = db.scalars(
+            select(CartItem)
+            .where(CartItem.user_id == order_in.user_id, CartItem.product_id.in_(list(bought)), LIVE_ITEM)
+            .order_by(CartItem.item_id)
+            .with_for_update()
+        ).all()
+        for cart_item in cart_items:
+            taken = min(cart_item.quantity, bought[cart_item.product_id])
+            bought[cart_item.product_id] -= taken
+            if taken == cart_item.quantity:
+                db.delete(cart_item)
+            else:
+                cart_item.quantity -= taken
         Products_crud.finalize_products(
             reservations=reservations,
-            order_id=str(db_order.id),
+            order_id=str(db_order.order_id),
             db=db
         )
     except Exception as e:
@@ -144,6 +249,9 @@ def create_order(db: Session, order_in: OrderCreate) -> Order:
  
     return db_order
  
+async def create_order_async(db: AsyncSession, order_in: OrderCreate) -> Order:
+    return await db.run_sync(create_order, order_in)
+ 
 def get_order(db: Session, order_id: int) -> Order:
     order = db.query(Order).get(order_id)
     if not order:
@@ -28,10 +28,13 @@ class Order(Base):
 class CartItem(Base):
     __tablename__ = "cart_items"
     item_id = Column(Integer, primary_key=True, index=True)
+    cart_id = Column(Integer, ForeignKey("carts.cart_id"), nullable=False, index=True)
     user_id = Column(Integer, nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
+    # Stock held for the item is released by the sweeper once this passes
+    reserved_until = Column(DateTime, nullable=True, index=True)
 
     cart = relationship("Cart", back_populates="items")
 
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status, HTTPException
 from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db, get_read_db, get_async_db
 import Orders.crud, Orders.schemas
 from utils import get_current_user
 
@@ -22,12 +23,12 @@ def get_cart(cart_id: int, db: Session = Depends(get_db)):
     return Orders.crud.get_cart(db, cart_id)
 
 @cart_router.post("/{cart_id}/items", response_model=Orders.schemas.CartItemResponse)
-def add_item_to_cart(cart_id: int, item_in: Orders.schemas.CartItemCreate, db: Session = Depends(get_db)):
-    return Orders.crud.add_item(db, cart_id, item_in)
+async def add_item_to_cart(cart_id: int, item_in: Orders.schemas.CartItemCreate, db: AsyncSession = Depends(get_async_db)):
+    return await Orders.crud.add_item_async(db, cart_id, item_in)
 
 @cart_router.get("/{cart_id}/items", response_model=list[Orders.schemas.CartItemResponse])
-def list_items(cart_id: int, db: Session = Depends(get_db)):
-    return Orders.crud.list_cart_items(db, cart_id)
+async def list_items(cart_id: int, db: AsyncSession = Depends(get_async_db)):
+    return await Orders.crud.list_cart_items_async(db, cart_id)
 
 @cart_router.put("/{cart_id}/items/{product_id}", response_model=Orders.schemas.CartItemResponse)
 def update_item(cart_id: int, product_id: int, quantity: int, db: Session = Depends(get_db)):
@@ -48,15 +49,15 @@ def clear_cart(cart_id: int, db: Session = Depends(get_db)):
 order_router = APIRouter(prefix="/orders", tags=["Orders"])
 
 @order_router.post("/", response_model=Orders.schemas.OrderResponse, status_code=status.HTTP_201_CREATED)
-def create_order(order_in: Orders.schemas.OrderCreate, db: Session = Depends(get_db)):
-    return Orders.crud.create_order(db, order_in)
+async def create_order(order_in: Orders.schemas.OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    return await Orders.crud.create_order_async(db, order_in)
 
 @order_router.get("/{order_id}", response_model=Orders.schemas.OrderResponse)
-def get_order(order_id: int, db: Session = Depends(get_db)):
+def get_order(order_id: int, db: Session = Depends(get_read_db)):
     return Orders.crud.get_order(db, order_id)
 
 @order_router.get("/", response_model=list[Orders.schemas.OrderResponse])
-def list_orders(db: Session = Depends(get_db)):
+def list_orders(db: Session = Depends(get_read_db)):
     return Orders.crud.list_orders(db)
 
 @order_router.patch("/{order_id}/status", response_model=Orders.schemas.OrderResponse)
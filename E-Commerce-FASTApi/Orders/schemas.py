@@ -13,6 +13,7 @@ class CartItemResponse(BaseModel):
     product_id: int
     quantity: int
     remaining_available: Optional[int] = None  # Optional for enhanced API
+    reserved_until: Optional[datetime] = None
  
     class Config:
         from_attributes = True
@@ -0,0 +1,134 @@
+from threading import RLock
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+import Products.models
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+CLOSURE_INSERT_BATCH = 1000
+
+
+class CategoryTree:
+    """In-memory copy of the category tree, loaded with one query and shared by all requests"""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._nodes: Dict[int, Dict[str, Any]] = {}
+        self._descendants: Dict[int, Set[int]] = {}
+        # category_id -> database stamp already reloaded for, while the closure table lags the tree
+        self._settled: Dict[int, Tuple[Any, Any]] = {}
+        self.ready = False
+
+    @staticmethod
+    def _build(rows) -> Tuple[Dict[int, Dict[str, Any]], List[Tuple[int, int, int]]]:
+        nodes = {
+            row.id: {
+                "id": row.id,
+                "name": row.name,
+                "parent_id": row.parent_id,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at,
+                "version": row.version,
+                "children": []
+            }
+            for row in rows
+        }
+        for node in nodes.values():
+            parent = nodes.get(node["parent_id"])
+            if parent is not None:
+                parent["children"].append(node)
+
+        # (ancestor, descendant, depth) for every node walking up to its root
+        closure = []
+        for category_id in nodes:
+            current, depth, seen = category_id, 0, set()
+            while current in nodes and current not in seen:
+                seen.add(current)
+                closure.append((current, category_id, depth))
+                current, depth = nodes[current]["parent_id"], depth + 1
+        return nodes, closure
+
+    def load(self, db: Session) -> List[Tuple[int, int, int]]:
+        rows = db.execute(
+            select(
+                Products.models.Category.id,
+                Products.models.Category.name,
+                Products.models.Category.parent_id,
+                Products.models.Category.created_at,
+                Products.models.Category.updated_at,
+                Products.models.Category.version
+            ).order_by(Products.models.Category.id)
+        ).all()
+        nodes, closure = self._build(rows)
+        descendants: Dict[int, Set[int]] = {category_id: set() for category_id in nodes}
+        for ancestor_id, descendant_id, _ in closure:
+            descendants[ancestor_id].add(descendant_id)
+        with self._lock:
+            self._nodes = nodes
+            self._descendants = descendants
+            self._settled = {}
+            self.ready = True
+        return closure
+
+    def rebuild(self, db: Session, only_if_changed: bool = False) -> bool:
+        """Reload the tree and rewrite the closure table; call after categories change.
+
+        With only_if_changed the stored closure is compared first and left alone
+        when it already matches, so periodic calls from every worker stay cheap.
+        """
+        closure = self.load(db)
+        CategoryClosure = Products.models.CategoryClosure
+        if only_if_changed:
+            stored = set(db.execute(
+                select(CategoryClosure.ancestor_id, CategoryClosure.descendant_id, CategoryClosure.depth)
+            ).tuples())
+            if stored == set(closure):
+                db.rollback()
+                return False
+        db.execute(delete(CategoryClosure))
+        for start in range(0, len(closure), CLOSURE_INSERT_BATCH):
+            db.execute(insert(CategoryClosure), [
+                {"ancestor_id": ancestor_id, "descendant_id": descendant_id, "depth": depth}
+                for ancestor_id, descendant_id, depth in closure[start:start + CLOSURE_INSERT_BATCH]
+            ])
+        db.commit()
+        return True
+
+    def categories(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._nodes.values())
+
+    def has(self, category_id: int) -> bool:
+        with self._lock:
+            return category_id in self._nodes
+
+    def descendant_ids(self, category_id: int) -> Optional[Set[int]]:
+        with self._lock:
+            return self._descendants.get(category_id)
+
+    def subtree(self, category_id: int) -> Optional[Dict[str, Any]]:
+        """The category's node with its children nested below it"""
+        with self._lock:
+            return self._nodes.get(category_id)
+
+    def stamp(self, category_id: int) -> Optional[Tuple[int, int]]:
+        """(categories, sum of row versions) in the subtree, to compare with the database's"""
+        with self._lock:
+            descendants = self._descendants.get(category_id)
+            if descendants is None:
+                return None
+            return len(descendants), sum(self._nodes[descendant]["version"] for descendant in descendants)
+
+    def matches(self, category_id: int, stamp: Tuple[Any, Any]) -> bool:
+        """Whether the subtree agrees with the database's stamp, or was reloaded for it already"""
+        with self._lock:
+            return self.stamp(category_id) == stamp or self._settled.get(category_id) == stamp
+
+    def settle(self, category_id: int, stamp: Tuple[Any, Any]):
+        with self._lock:
+            self._settled[category_id] = stamp
+
+
+category_tree = CategoryTree()
@@ -1,20 +1,88 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc, asc
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import joinedload
-from typing import Tuple, Dict, Any, Optional, List, Union
+from sqlalchemy import Select, and_, or_, case, func, desc, asc, bindparam, insert, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import noload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Collection, Mapping, Tuple, Dict, Any, NamedTuple, Optional, List, Union
+from datetime import datetime
+from decimal import Decimal
 from database import get_db
+from cache import TTLCache, make_etag, response_cache
+from Products.categories import category_tree
+from Products.hot_stock import hot_stock
+from Products.sampler import in_stock_sampler
+from Products.search import MAX_SEARCH_RESULTS, product_search_index
 import Products.models, Products.schemas
+import Orders.models
+import base64
+import binascii
+import heapq
+import itertools
+import json
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+COUNT_STRATEGIES = ("exact", "cached", "estimated", "none")
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "2048"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+# Ranked search ids checked against the filters per query when sorting by relevance
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "500"))
+
+# normalized filter set -> total matching products
+count_cache = TTLCache(maxsize=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL)
+
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", "60"))
+FACET_BRAND_LIMIT = 20
+PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2000]
+
+# How many price changes the product detail embeds
+PRICE_HISTORY_EMBED_LIMIT = int(os.getenv("PRICE_HISTORY_EMBED_LIMIT", "5"))
+PRICE_HISTORY_PAGE_SIZE = 50
+
+# How many of a user's latest orders seed their recommendations
+RECOMMENDATION_RECENT_ORDERS = int(os.getenv("RECOMMENDATION_RECENT_ORDERS", "10"))
+
+# normalized filter set -> facet counts
+facet_cache = TTLCache(maxsize=COUNT_CACHE_SIZE, ttl=FACET_CACHE_TTL)
+
+def invalidate_listing_caches():
+    count_cache.clear()
+    facet_cache.clear()
+    response_cache.invalidate("products:list")
+
+def invalidate_product_caches(*product_ids: int):
+    invalidate_listing_caches()
+    response_cache.invalidate(*[f"product:{product_id}" for product_id in product_ids])
+
+def track_stock(*inventories: Products.models.Inventory):
+    """Mirror committed inventory levels into the in-stock sampler"""
+    for inventory in inventories:
+        in_stock_sampler.update(inventory.product_id, inventory.quantity_available)
+
+def sample_in_stock_products(db: Session, k: int, exclude: Collection[int] = ()) -> List[int]:
+    if not in_stock_sampler.ready:
+        in_stock_sampler.reconcile(db)
+    return in_stock_sampler.sample(k, exclude)
+
+class ProductPage(NamedTuple):
+    total: Optional[int]
+    total_exact: bool
+    has_more: bool
+    products: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
 def create_product_manual(db: Session, product: Products.schemas.ProductCreate):
     try:
         db_product = Products.models.Product(**product.model_dump())
         db.add(db_product)
         db.commit()
         db.refresh(db_product)
+        invalidate_listing_caches()
+        product_search_index.index_product(db_product)
+        # A new product has no price history; skip the lazy load on serialization
+        set_committed_value(db_product, "price_history", [])
         return db_product
     except Exception as e:
         db.rollback()
@@ -28,20 +96,472 @@ def get_product_by_id(db: Session, id: int):
     product = db.query(Products.models.Product).filter(Products.models.Product.id == id).first()
     return product
 
+def _category_from_node(node: Dict[str, Any]) -> Products.models.Category:
+    """A detached Category carrying the in-memory subtree, so serializing it never lazy loads"""
+    category = Products.models.Category(
+        **{key: node[key] for key in ("id", "name", "parent_id", "created_at", "updated_at", "version")}
+    )
+    set_committed_value(category, "children", [_category_from_node(child) for child in node["children"]])
+    return category
+
+async def get_product_by_id_async(db: AsyncSession, id: int):
+    """The product row in one query; its category subtree comes from the in-memory tree, however deep"""
+    product = await db.scalar(
+        select(Products.models.Product).where(Products.models.Product.id == id).options(noload(Products.models.Product.category))
+    )
+    if product:
+        if not category_tree.has(product.category_id):
+            await db.run_sync(category_tree.load)
+        node = category_tree.subtree(product.category_id)
+        set_committed_value(product, "category", _category_from_node(node) if node else None)
+        await db.run_sync(attach_price_history, product)
+    return product
+
+def _category_subtree(*aggregates):
+    """Aggregates over the product's category and everything below it, which the detail payload embeds"""
+    Category, CategoryClosure = Products.models.Category, Products.models.CategoryClosure
+    return (
+        select(*aggregates)
+        .select_from(CategoryClosure)
+        .join(Category, Category.id == CategoryClosure.descendant_id)
+        .where(CategoryClosure.ancestor_id == Products.models.Product.category_id)
+        .correlate(Products.models.Product)
+        .scalar_subquery()
+    )
+
+async def get_product_etag_async(db: AsyncSession, id: int) -> Optional[str]:
+    """ETag for the product detail from row versions and timestamps: index lookups, no payload loaded"""
+    Category = Products.models.Category
+    row = (await db.execute(
+        select(
+            Products.models.Product.category_id,
+            Products.models.Product.id,
+            Products.models.Product.version,
+            Products.models.Product.created_at,
+            Products.models.Product.updated_at,
+            Products.models.Inventory.last_updated,
+            # A child added, removed, renamed or moved changes the embedded category tree
+            _category_subtree(func.count()).label("subtree_size"),
+            _category_subtree(func.sum(Category.version)).label("subtree_versions"),
+            _category_subtree(func.max(func.coalesce(Category.updated_at, Category.created_at)))
+        )
+        .outerjoin(Products.models.Inventory, Products.models.Inventory.product_id == Products.models.Product.id)
+        .where(Products.models.Product.id == id)
+    )).first()
+    if row is None:
+        return None
+    # The detail embeds the in-memory subtree, so reload it when another worker changed it
+    stamp = (row.subtree_size, row.subtree_versions)
+    if not category_tree.matches(row.category_id, stamp):
+        await db.run_sync(category_tree.load)
+        category_tree.settle(row.category_id, stamp)
+    return make_etag(*row[1:])
+
 def get_product_by_name(db: Session, name: str):
     return db.query(Products.models.Product).filter(Products.models.Product.name == name).first()
 
 def get_product_by_brand(db: Session, brand: str):
     return db.query(Products.models.Product).filter(Products.models.Product.brand == brand).first()
 
+def in_category_tree(category_id: int):
+    """Products in a category or any of its descendants, via the closure table's primary key.
+
+    The exact match keeps a category created since the last closure rebuild filterable.
+    """
+    return or_(
+        Products.models.Product.category_id == category_id,
+        Products.models.Product.category_id.in_(
+            select(Products.models.CategoryClosure.descendant_id)
+            .where(Products.models.CategoryClosure.ancestor_id == category_id)
+        )
+    )
+
 def get_products_by_category(db: Session, category_id: int):
-    products = db.query(Products.models.Product).filter(Products.models.Product.category_id == category_id).all()
+    products = db.query(Products.models.Product).filter(in_category_tree(category_id)).all()
     return products
 
 def get_all_categories(db: Session):
     categories = db.query(Products.models.Category).all()
     return categories
 
+def get_category_tree(db: Session) -> List[Dict[str, Any]]:
+    """All categories with nested children, served from the in-memory tree"""
+    if not category_tree.ready:
+        category_tree.load(db)
+    return category_tree.categories()
+
+def rebuild_category_tree(db: Session, only_if_changed: bool = False) -> bool:
+    if not category_tree.rebuild(db, only_if_changed):
+        return False
+    invalidate_listing_caches()
+    response_cache.invalidate("categories")
+    return True
+
+def _ranked_search(search: Optional[str]) -> Optional[List[Tuple[int, float]]]:
+    """All ranked matches from the search index, or None when it can't answer yet"""
+    if not search or not product_search_index.ready:
+        return None
+    return product_search_index.search(search)
+
+def attribute_filters(params: Mapping[str, str]) -> Dict[str, str]:
+    """attr.<name>=value query params for promoted attributes.
+
+    Text attributes match any of a comma-separated list; numeric ones (rating) are a minimum.
+    """
+    filters = {}
+    for key, value in params.items():
+        if not key.startswith("attr."):
+            continue
+        name = key[len("attr."):]
+        if name not in Products.models.PROMOTED_ATTRIBUTES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cannot filter on attribute '{name}'; filterable: {sorted(Products.models.PROMOTED_ATTRIBUTES)}"
+            )
+        if Products.models.PROMOTED_ATTRIBUTES[name][1] == "number":
+            try:
+                float(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"attr.{name} must be a number")
+        filters[key] = value
+    return filters
+
+def _attribute_condition(name: str, value: str):
+    column_name, kind = Products.models.PROMOTED_ATTRIBUTES[name]
+    column = getattr(Products.models.Product, column_name)
+    if kind == "number":
+        return column >= float(value)
+    return column.in_([item.strip().lower() for item in value.split(",") if item.strip()])
+
+def _product_list_query(
+    search: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    ranked: Optional[List[Tuple[int, float]]] = None
+) -> Select:
+    query = select(Products.models.Product)
+
+    if ranked is not None:
+        query = query.where(Products.models.Product.id.in_([product_id for product_id, _ in ranked]))
+    elif search:
+        # Until the index is built, fall back to a scan
+        search_term = f"%{search}%"
+        query = query.where(
+            or_(
+                Products.models.Product.name.like(search_term),
+                Products.models.Product.brand.like(search_term)
+            )
+        )
+
+    if filters:
+        if filters.get('min_price'):
+            query = query.where(Products.models.Product.price >= filters['min_price'])
+        if filters.get('max_price'):
+            query = query.where(Products.models.Product.price <= filters['max_price'])
+        if filters.get('category_id'):
+            query = query.where(in_category_tree(filters['category_id']))
+        if filters.get('in_stock_only'):
+            query = query.where(Products.models.Product.inventory.has(Products.models.Inventory.quantity_available > 0))
+        for key, value in filters.items():
+            if key.startswith("attr.") and value:
+                query = query.where(_attribute_condition(key[len("attr."):], value))
+
+    return query
+
+# ---------- Price history ----------
+
+def _price_history_summary(db: Session, product_id: int) -> Optional[Dict[str, Any]]:
+    PriceHistory = Products.models.PriceHistory
+    changes, min_old, min_new, max_old, max_new, last_changed_at = db.execute(
+        select(
+            func.count(),
+            func.min(PriceHistory.old_price),
+            func.min(PriceHistory.new_price),
+            func.max(PriceHistory.old_price),
+            func.max(PriceHistory.new_price),
+            func.max(PriceHistory.changed_at)
+        ).where(PriceHistory.product_id == product_id)
+    ).one()
+    if not changes:
+        return None
+    return {
+        "changes": changes,
+        "min_price": min(min_old, min_new),
+        "max_price": max(max_old, max_new),
+        "last_changed_at": last_changed_at
+    }
+
+def attach_price_history(db: Session, product: Products.models.Product, limit: int = PRICE_HISTORY_EMBED_LIMIT):
+    """Populate product.price_history with the latest changes only, plus a summary of the rest"""
+    PriceHistory = Products.models.PriceHistory
+    latest = db.scalars(
+        select(PriceHistory)
+        .where(PriceHistory.product_id == product.id)
+        .order_by(PriceHistory.changed_at.desc(), PriceHistory.id.desc())
+        .limit(limit)
+    ).all()
+    set_committed_value(product, "price_history", latest)
+    product.price_summary = _price_history_summary(db, product.id)
+    return product
+
+def get_price_history_page(
+    db: Session,
+    product_id: int,
+    limit: int = PRICE_HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """Newest-first price changes, keyset-paged on (changed_at, id)"""
+    PriceHistory = Products.models.PriceHistory
+    query = select(PriceHistory).where(PriceHistory.product_id == product_id)
+    if cursor:
+        changed_at, last_id = _unpack_cursor(cursor, "price_history")
+        changed_at = datetime.fromisoformat(changed_at)
+        query = query.where(or_(
+            PriceHistory.changed_at < changed_at,
+            and_(PriceHistory.changed_at == changed_at, PriceHistory.id < last_id)
+        ))
+    entries = db.scalars(
+        query.order_by(PriceHistory.changed_at.desc(), PriceHistory.id.desc()).limit(limit + 1)
+    ).all()
+
+    if not entries and not cursor and not db.get(Products.models.Product, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = _pack_cursor("price_history", entries[-1].changed_at.isoformat(), entries[-1].id)
+    return {"entries": entries, "next_cursor": next_cursor}
+
+# ---------- Keyset pagination ----------
+
+SORT_COLUMNS = {
+    "created_at": Products.models.Product.created_at,
+    "price": Products.models.Product.price,
+    "name": Products.models.Product.name,
+    "id": Products.models.Product.id,
+    "rating": Products.models.Product.attr_rating,
+}
+# Sort keys that can be NULL (a product without the attribute)
+NULLABLE_SORTS = {"rating"}
+
+def _normalize_sort(sort_by: str) -> str:
+    return sort_by if sort_by in SORT_COLUMNS else "created_at"
+
+def _pack_cursor(kind: str, value: Any, last_id: int) -> str:
+    payload = json.dumps([kind, value, last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _unpack_cursor(cursor: str, kind: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_kind, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_kind != kind:
+            raise ValueError("cursor was issued for a different sort")
+        return value, int(last_id)
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+def encode_cursor(row: Dict[str, Any], sort_by: str) -> str:
+    """Opaque cursor holding the last row's sort key and id"""
+    sort_by = _normalize_sort(sort_by)
+    value = row[SORT_COLUMNS[sort_by].key]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    return _pack_cursor(sort_by, value, row["id"])
+
+def decode_cursor(cursor: str, sort_by: str) -> Tuple[Any, int]:
+    sort_by = _normalize_sort(sort_by)
+    value, last_id = _unpack_cursor(cursor, sort_by)
+    try:
+        if sort_by == "created_at":
+            value = datetime.fromisoformat(value)
+        elif sort_by == "price":
+            value = Decimal(value)
+        elif sort_by == "rating" and value is not None:
+            value = float(value)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    return value, last_id
+
+def _sorted_page(
+    query: Select,
+    skip: int,
+    limit: int,
+    sort_by: str,
+    sort_dir: str,
+    cursor: Optional[str] = None
+) -> Select:
+    sort_by = _normalize_sort(sort_by)
+    sort_column = SORT_COLUMNS[sort_by]
+    id_column = Products.models.Product.id
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_by)
+        query = query.where(_after_cursor(sort_column, id_column, value, last_id, sort_dir, sort_by in NULLABLE_SORTS))
+        skip = 0
+
+    # id breaks ties so keyset and offset pages are both deterministic
+    if sort_dir == "desc":
+        query = query.order_by(desc(sort_column), desc(id_column))
+    else:
+        query = query.order_by(asc(sort_column), asc(id_column))
+
+    return _summary_projection(query, sort_by).offset(skip).limit(limit)
+
+def _after_cursor(sort_column, id_column, value: Any, last_id: int, sort_dir: str, nullable: bool = False):
+    """Rows past (value, last_id); NULL sort keys order before every value, as in MySQL and SQLite"""
+    if value is None:
+        if sort_dir == "desc":
+            return and_(sort_column.is_(None), id_column < last_id)
+        return or_(sort_column.isnot(None), id_column > last_id)
+    if sort_dir == "desc":
+        condition = or_(sort_column < value, and_(sort_column == value, id_column < last_id))
+        return or_(condition, sort_column.is_(None)) if nullable else condition
+    return or_(sort_column > value, and_(sort_column == value, id_column > last_id))
+
+def _summary_projection(query: Select, sort_by: Optional[str] = None) -> Select:
+    """Swap the ORM entity for exactly the ProductSummary columns (plus the sort key when it isn't one of them)"""
+    columns = [
+        Products.models.Product.id,
+        Products.models.Product.name,
+        Products.models.Product.price,
+        Products.models.Product.brand,
+        func.coalesce(Products.models.Category.name, "Unknown").label("category_name"),
+        func.coalesce(Products.models.Inventory.quantity_available, 0).label("stock_quantity"),
+        Products.models.Product.attr_rating.label("rating")
+    ]
+    if sort_by == "created_at":
+        columns.append(Products.models.Product.created_at)
+    elif sort_by == "rating":
+        columns.append(Products.models.Product.attr_rating)
+
+    return (
+        query.with_only_columns(*columns)
+        .outerjoin(Products.models.Category, Products.models.Category.id == Products.models.Product.category_id)
+        .outerjoin(Products.models.Inventory, Products.models.Inventory.product_id == Products.models.Product.id)
+    )
+
+# ---------- Total counts ----------
+
+def _filter_cache_key(search: Optional[str], filters: Optional[Dict[str, Any]]) -> tuple:
+    active = {key: value for key, value in (filters or {}).items() if value not in (None, False, "")}
+    return (search.strip().lower() if search else None, tuple(sorted(active.items())))
+
+def _estimate_count(db: Session, query: Select) -> int:
+    """Optimizer row estimate from MySQL's EXPLAIN; no rows are scanned"""
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    plan = db.execute(text(f"EXPLAIN {compiled}")).mappings().first()
+    return int((plan["rows"] or 0) * float(plan.get("filtered") or 100) / 100)
+
+def _count_products(db: Session, queries: List[Select], strategy: str, cache_key: tuple) -> Tuple[Optional[int], bool]:
+    """Returns (total, exact) over the chunk queries according to the requested count strategy"""
+    if strategy == "none":
+        return None, False
+    if strategy == "estimated" and db.get_bind().dialect.name == "mysql":
+        return sum(_estimate_count(db, query) for query in queries), False
+
+    if strategy in ("cached", "estimated"):
+        total = count_cache.get(cache_key)
+        if total is not None:
+            return total, False
+
+    total = sum(db.scalar(select(func.count()).select_from(query.subquery())) for query in queries)
+    if strategy != "exact":
+        count_cache.set(cache_key, total)
+    return total, True
+
+def _page_result(total: Optional[int], exact: bool, products: List[Dict[str, Any]], limit: int, sort_by: str) -> ProductPage:
+    has_more = len(products) > limit
+    products = products[:limit]
+    next_cursor = encode_cursor(products[-1], sort_by) if has_more else None
+    return ProductPage(total, exact, has_more, products, next_cursor)
+
+def _relevance_page(
+    db: Session,
+    search: str,
+    filters: Optional[Dict[str, Any]],
+    ranked: List[Tuple[int, float]],
+    skip: int,
+    limit: int,
+    count: str = "exact"
+) -> ProductPage:
+    """Walk the ranking in windows, keeping the ids that pass the filters, until the page is full.
+
+    Each window is one bounded IN query. An exact count keeps walking to the end;
+    otherwise the total is extrapolated from the match rate of the windows read.
+    """
+    wanted = skip + limit + 1
+    ordered: List[int] = []
+    scanned = 0
+    while scanned < len(ranked) and (len(ordered) < wanted or count == "exact"):
+        window = ranked[scanned:scanned + SEARCH_RANK_WINDOW]
+        matching = set(db.scalars(
+            _product_list_query(search, filters, window).with_only_columns(Products.models.Product.id)
+        ))
+        ordered.extend(product_id for product_id, _ in window if product_id in matching)
+        scanned += len(window)
+
+    if count == "none":
+        total, exact = None, False
+    elif scanned >= len(ranked):
+        total, exact = len(ordered), True
+    else:
+        total, exact = round(len(ordered) * len(ranked) / scanned), False
+    page_ids = ordered[skip:skip + limit]
+    rows = db.execute(
+        _summary_projection(select(Products.models.Product).where(Products.models.Product.id.in_(page_ids)))
+    ).mappings().all()
+    by_id = {row["id"]: row for row in rows}
+    return ProductPage(total, exact, skip + limit < len(ordered), [by_id[product_id] for product_id in page_ids])
+
+def _search_queries(
+    search: Optional[str],
+    filters: Optional[Dict[str, Any]],
+    ranked: Optional[List[Tuple[int, float]]]
+) -> List[Select]:
+    """The filtered listing as one query per MAX_SEARCH_RESULTS ranked ids, so every match is covered"""
+    if not ranked:
+        return [_product_list_query(search, filters, ranked)]
+    return [
+        _product_list_query(search, filters, ranked[start:start + MAX_SEARCH_RESULTS])
+        for start in range(0, len(ranked), MAX_SEARCH_RESULTS)
+    ]
+
+def _sort_key(db: Session, sort_by: str):
+    """Python ordering matching ORDER BY sort_column, id with NULLs first"""
+    column = SORT_COLUMNS[_normalize_sort(sort_by)].key
+    # MySQL compares names case-insensitively
+    fold = str.casefold if column == "name" and db.get_bind().dialect.name == "mysql" else None
+
+    def key(row):
+        value = row[column]
+        if value is None:
+            return (False, 0, row["id"])
+        return (True, fold(value) if fold else value, row["id"])
+    return key
+
+def _sorted_products(
+    db: Session,
+    queries: List[Select],
+    skip: int,
+    limit: int,
+    sort_by: str,
+    sort_dir: str,
+    cursor: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """One sorted page across the chunk queries: each returns its own first skip + limit rows and they are merged"""
+    if len(queries) == 1:
+        return db.execute(_sorted_page(queries[0], skip, limit, sort_by, sort_dir, cursor)).mappings().all()
+    skip = 0 if cursor else skip
+    pages = [
+        db.execute(_sorted_page(query, 0, skip + limit, sort_by, sort_dir, cursor)).mappings().all()
+        for query in queries
+    ]
+    merged = heapq.merge(*pages, key=_sort_key(db, sort_by), reverse=sort_dir == "desc")
+    return list(itertools.islice(merged, skip, skip + limit))
+
 def get_paginated_products(
     db: Session, 
     skip: int, 
@@ -49,44 +569,166 @@ def get_paginated_products(
     search: Optional[str] = None,
     sort_by: str = "created_at",
     sort_dir: str = "desc",
-    filters: Optional[Dict[str, Any]] = None
-) -> Tuple[int, List[Products.models.Product]]:
-    try:
-        query = db.query(Products.models.Product).options(joinedload(Products.models.Product.category))
-        
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Products.models.Product.name.like(search_term),
-                    Products.models.Product.brand.like(search_term)
-                )
-            )
-        
-        if filters:
-            if filters.get('min_price'):
-                query = query.filter(Products.models.Product.price >= filters['min_price'])
-            if filters.get('max_price'):
-                query = query.filter(Products.models.Product.price <= filters['max_price'])
-            if filters.get('category_id'):
-                query = query.filter(Products.models.Product.category_id == filters['category_id'])
-            if filters.get('in_stock_only'):
-                query = query.filter(Products.models.Product.stock_quantity > 0)
-
-        total = query.count()
-
-        if hasattr(Products.models.Product, sort_by):
-            sort_column = getattr(Products.models.Product, sort_by)
-            if sort_dir == "desc":
-                query = query.order_by(desc(sort_column))
-            else:
-                query = query.order_by(asc(sort_column))
-
-        products = query.offset(skip).limit(limit).all()
-        return total, products
-    
-    except Exception as e:
-        raise
+    filters: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+    count: str = "exact"
+) -> ProductPage:
+    ranked = _ranked_search(search)
+    if sort_by == "relevance" and ranked is not None:
+        return _relevance_page(db, search, filters, ranked, skip, limit, count)
+    queries = _search_queries(search, filters, ranked)
+
+    total, exact = _count_products(db, queries, count, _filter_cache_key(search, filters))
+    # One extra row tells us whether another page exists without counting
+    products = _sorted_products(db, queries, skip, limit + 1, sort_by, sort_dir, cursor)
+    return _page_result(total, exact, products, limit, sort_by)
+
+async def get_paginated_products_async(
+    db: AsyncSession,
+    skip: int,
+    limit: int,
+    search: Optional[str] = None,
+    sort_by: str = "created_at",
+    sort_dir: str = "desc",
+    filters: Optional[Dict[str, Any]] = None,
+    cursor: Optional[str] = None,
+    count: str = "exact"
+) -> ProductPage:
+    ranked = _ranked_search(search)
+    if sort_by == "relevance" and ranked is not None:
+        return await db.run_sync(_relevance_page, search, filters, ranked, skip, limit, count)
+    queries = _search_queries(search, filters, ranked)
+
+    total, exact = await db.run_sync(_count_products, queries, count, _filter_cache_key(search, filters))
+    products = await db.run_sync(_sorted_products, queries, skip, limit + 1, sort_by, sort_dir, cursor)
+    return _page_result(total, exact, products, limit, sort_by)
+
+# ---------- Facets ----------
+
+def _price_bucket_label(lower: int, upper: Optional[int]) -> str:
+    return f"{lower}-{upper}" if upper is not None else f"{lower}+"
+
+def _facet_queries(search: Optional[str], filters: Optional[Dict[str, Any]]) -> List[Select]:
+    """A grouped query per chunk of search matches; the caller folds all their rows into per-dimension counts"""
+    return [_facet_query(query) for query in _search_queries(search, filters, _ranked_search(search))]
+
+def _facet_query(query: Select) -> Select:
+    filtered = query.with_only_columns(
+        Products.models.Product.id,
+        Products.models.Product.category_id,
+        Products.models.Product.brand,
+        Products.models.Product.price
+    ).subquery()
+
+    bounds = list(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None]))
+    price_bucket = case(
+        *[(filtered.c.price < upper, _price_bucket_label(lower, upper)) for lower, upper in bounds if upper is not None],
+        else_=_price_bucket_label(bounds[-1][0], None)
+    ).label("price_bucket")
+    in_stock = case((Products.models.Inventory.quantity_available > 0, True), else_=False).label("in_stock")
+
+    return (
+        select(
+            filtered.c.category_id,
+            Products.models.Category.name.label("category_name"),
+            filtered.c.brand,
+            price_bucket,
+            in_stock,
+            func.count().label("count")
+        )
+        .select_from(filtered)
+        .outerjoin(Products.models.Inventory, Products.models.Inventory.product_id == filtered.c.id)
+        .outerjoin(Products.models.Category, Products.models.Category.id == filtered.c.category_id)
+        .group_by(filtered.c.category_id, Products.models.Category.name, filtered.c.brand, price_bucket, in_stock)
+    )
+
+def _fold_facets(rows) -> dict:
+    categories: Dict[int, dict] = {}
+    brands: Dict[str, int] = {}
+    buckets = {_price_bucket_label(lower, upper): 0 for lower, upper in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + [None])}
+    availability = {"in_stock": 0, "out_of_stock": 0}
+    total = 0
+
+    for row in rows:
+        total += row.count
+        category = categories.setdefault(row.category_id, {"id": row.category_id, "name": row.category_name or "Unknown", "count": 0})
+        category["count"] += row.count
+        if row.brand:
+            brands[row.brand] = brands.get(row.brand, 0) + row.count
+        buckets[row.price_bucket] += row.count
+        availability["in_stock" if row.in_stock else "out_of_stock"] += row.count
+
+    return {
+        "total": total,
+        "categories": sorted(categories.values(), key=lambda item: (-item["count"], item["name"])),
+        "brands": [
+            {"name": name, "count": count}
+            for name, count in sorted(brands.items(), key=lambda item: (-item[1], item[0]))[:FACET_BRAND_LIMIT]
+        ],
+        "price_buckets": [{"range": label, "count": count} for label, count in buckets.items()],
+        "availability": availability
+    }
+
+def get_product_facets(db: Session, search: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> dict:
+    cache_key = _filter_cache_key(search, filters)
+    facets = facet_cache.get(cache_key)
+    if facets is None:
+        facets = _fold_facets(itertools.chain.from_iterable(db.execute(query) for query in _facet_queries(search, filters)))
+        facet_cache.set(cache_key, facets)
+    return facets
+
+async def get_product_facets_async(db: AsyncSession, search: Optional[str] = None, filters: Optional[Dict[str, Any]] = None) -> dict:
+    cache_key = _filter_cache_key(search, filters)
+    facets = facet_cache.get(cache_key)
+    if facets is None:
+        facets = _fold_facets([row for query in _facet_queries(search, filters) for row in (await db.execute(query)).all()])
+        facet_cache.set(cache_key, facets)
+    return facets
+
+def sync_promoted_attributes(db: Session, batch_size: int = 1000) -> int:
+    """Backfill shadow columns for rows written before an attribute was promoted.
+
+    Rows with an empty shadow column are compared with their JSON and written only
+    when the two disagree, so products that simply lack an attribute are read on
+    each run but never rewritten (which would bump their version and updated_at).
+    """
+    Product = Products.models.Product
+    columns = [getattr(Product, column) for column, _ in Products.models.PROMOTED_ATTRIBUTES.values()]
+    candidates = and_(Product.attributes.isnot(None), or_(*[column.is_(None) for column in columns]))
+    last_id, synced = 0, 0
+    while True:
+        rows = db.execute(
+            select(Product.id, Product.attributes, *columns)
+            .where(candidates, Product.id > last_id).order_by(Product.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        changes = []
+        for row in rows:
+            values = Products.models.promoted_values(row.attributes)
+            if any(getattr(row, column) != value for column, value in values.items()):
+                changes.append({"id": row.id, **values})
+        if changes:
+            db.execute(update(Product), changes)
+            db.commit()
+        last_id, synced = rows[-1].id, synced + len(changes)
+    if synced:
+        invalidate_listing_caches()
+    return synced
+
+def refresh_search_index(db: Session):
+    product_search_index.rebuild(db)
+
+def to_product_summary(row: Dict[str, Any]) -> dict:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "price": float(row["price"]),
+        "brand": row["brand"],
+        "stock_quantity": row["stock_quantity"],
+        "category_name": row["category_name"],
+        "rating": row["rating"]
+    }
 
 def update_product(db: Session, product_id: int, product_update: Products.schemas.ProductUpdate):
     """Update a product with only the provided fields"""
@@ -117,6 +759,15 @@ def update_product(db: Session, product_id: int, product_update: Products.schema
             elif new_attributes == {}:
                 db_product.attributes = {}
                 
+    new_price = update_data.get('price')
+    if new_price is not None and Decimal(str(new_price)) != db_product.price:
+        db.add(Products.models.PriceHistory(
+            product_id=db_product.id,
+            old_price=db_product.price,
+            new_price=new_price,
+            reason="manual update"
+        ))
+
     for field, value in update_data.items():
         if hasattr(db_product, field):
             setattr(db_product, field, value)
@@ -124,11 +775,98 @@ def update_product(db: Session, product_id: int, product_update: Products.schema
     try:
         db.commit()
         db.refresh(db_product)
-        return db_product
+        invalidate_product_caches(db_product.id)
+        product_search_index.index_product(db_product)
+        return attach_price_history(db, db_product)
     except Exception as e:
         db.rollback()
         raise e
     
+def category_exists(db: Session, category_id: int) -> bool:
+    if not category_tree.ready:
+        category_tree.load(db)
+    return category_tree.has(category_id)
+
+def _merge_attributes(existing: Optional[Dict[str, Any]], new_attributes: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Same rules as update_product: a dict merges, {} clears, None leaves them alone
+    if new_attributes is None:
+        return existing
+    if new_attributes == {}:
+        return {}
+    merged = dict(existing or {})
+    merged.update(new_attributes)
+    return merged
+
+def bulk_update_products(db: Session, items: List[Products.schemas.ProductBulkUpdateItem]) -> Dict[str, Any]:
+    """Apply many partial updates by id: one IN lookup, then one executemany UPDATE per set of changed columns"""
+    invalid_categories = sorted({
+        item.category_id for item in items
+        if item.category_id is not None and not category_exists(db, item.category_id)
+    })
+    if invalid_categories:
+        raise HTTPException(status_code=400, detail=f"Invalid category_id: {invalid_categories}")
+
+    Product = Products.models.Product
+    ids = {item.id for item in items}
+    current = {
+        row.id: row._asdict()
+        for row in db.execute(
+            select(Product.id, Product.name, Product.brand, Product.attributes, Product.price).where(Product.id.in_(ids))
+        )
+    }
+
+    # Later items for the same id apply on top of earlier ones
+    changes: Dict[int, Dict[str, Any]] = {}
+    for item in items:
+        if item.id not in current:
+            continue
+        update_data = item.model_dump(exclude_unset=True, exclude={"id"})
+        row = changes.setdefault(item.id, {})
+        if "attributes" in update_data:
+            new_attributes = update_data.pop("attributes")
+            if new_attributes is not None:
+                existing = row.get("attributes", current[item.id]["attributes"])
+                row["attributes"] = _merge_attributes(existing, new_attributes)
+        row.update(update_data)
+
+    # Core UPDATEs bypass the model's attribute validator, so refresh the shadow columns here
+    for row in changes.values():
+        if "attributes" in row:
+            row.update(Products.models.promoted_values(row["attributes"]))
+
+    batches: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    for product_id, row in changes.items():
+        if row:
+            batches.setdefault(tuple(sorted(row)), []).append({"id": product_id, **row})
+
+    price_history = [
+        {"product_id": product_id, "old_price": current[product_id]["price"], "new_price": row["price"], "reason": "manual update"}
+        for product_id, row in changes.items()
+        if row.get("price") is not None and Decimal(str(row["price"])) != current[product_id]["price"]
+    ]
+
+    try:
+        for rows in batches.values():
+            db.execute(update(Product), rows)
+        if price_history:
+            db.execute(insert(Products.models.PriceHistory), price_history)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    updated_ids = sorted(product_id for product_id, row in changes.items() if row)
+    if updated_ids:
+        invalidate_product_caches(*updated_ids)
+        for product_id in updated_ids:
+            document = {**current[product_id], **changes[product_id]}
+            product_search_index.upsert(product_id, document["name"], document["brand"], document["attributes"])
+    return {
+        "updated": len(updated_ids),
+        "updated_ids": updated_ids,
+        "not_found": sorted(ids - current.keys())
+    }
+
 def get_inventory_by_product_id(db: Session, product_id: int):
     return db.query(Products.models.Inventory).filter(Products.models.Inventory.product_id == product_id).first()
 
@@ -149,6 +887,9 @@ def update_inventory_quantity(db: Session, product_id: int, quantity_delta: int,
     db.add(movement)
     db.commit()
     db.refresh(inventory)
+    invalidate_listing_caches()
+    hot_stock.refresh(db, product_id)
+    track_stock(inventory)
     return inventory
 
 def create_or_update_inventory(db: Session, product_id: int, data: Products.schemas.InventoryBase):
@@ -161,6 +902,9 @@ def create_or_update_inventory(db: Session, product_id: int, data: Products.sche
             setattr(inventory, key, value)
     db.commit()
     db.refresh(inventory)
+    invalidate_listing_caches()
+    hot_stock.refresh(db, product_id)
+    track_stock(inventory)
     return inventory
 
 def get_stock_movements_for_product(db: Session, product_id: int):
@@ -181,18 +925,93 @@ def update_inventory_settings(
 
     db.commit()
     db.refresh(inventory)
+    hot_stock.refresh(db, product_id)
+    track_stock(inventory)
     return inventory
 
+def _adjust_inventory(db: Session, product_id: int, available_delta: int, reserve_delta: int, guard) -> Optional[int]:
+    """Apply both deltas in one conditional UPDATE; the new quantity_available, or None if the guard failed.
+
+    The guard is evaluated by the database against the current row, so concurrent
+    reservations can't both pass a check made on a stale read.
+    """
+    Inventory = Products.models.Inventory
+    statement = (
+        update(Inventory)
+        .where(Inventory.product_id == product_id, guard)
+        .values(
+            quantity_available=Inventory.quantity_available + available_delta,
+            quantity_reserve=Inventory.quantity_reserve + reserve_delta
+        )
+    )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(statement.returning(Inventory.quantity_available)).scalar_one_or_none()
+    if db.execute(statement).rowcount != 1:
+        return None
+    return db.scalar(select(Inventory.quantity_available).where(Inventory.product_id == product_id))
+
+def _reserve(db: Session, product_id: int, quantity: int) -> Optional[int]:
+    Inventory = Products.models.Inventory
+    return _adjust_inventory(db, product_id, -quantity, quantity, Inventory.quantity_available >= quantity)
+
+def _lock_inventories(db: Session, product_ids: Collection[int]) -> Dict[int, List[int]]:
+    """product_id -> [quantity_available, quantity_reserve] for all items in one query, rows locked FOR UPDATE.
+
+    Locks are taken in product_id order, so two carts sharing products always
+    lock them in the same order and can't deadlock each other.
+    """
+    if not product_ids:
+        return {}
+    Inventory = Products.models.Inventory
+    rows = db.execute(
+        select(Inventory.product_id, Inventory.quantity_available, Inventory.quantity_reserve)
+        .where(Inventory.product_id.in_(sorted(set(product_ids))))
+        .order_by(Inventory.product_id)
+        .with_for_update()
+    )
+    return {product_id: [available or 0, reserve or 0] for product_id, available, reserve in rows}
+
+def _write_inventory_counts(db: Session, before: Dict[int, List[int]], after: Dict[int, List[int]]):
+    """Write the changed counters as deltas in one executemany UPDATE, guarded so neither goes negative"""
+    rows = [
+        {
+            "locked_product_id": product_id,
+            "available_delta": after[product_id][0] - before[product_id][0],
+            "reserve_delta": after[product_id][1] - before[product_id][1]
+        }
+        for product_id in sorted(after) if after[product_id] != before[product_id]
+    ]
+    if not rows:
+        return
+    inventory = Products.models.Inventory.__table__
+    available = inventory.c.quantity_available + bindparam("available_delta")
+    reserve = inventory.c.quantity_reserve + bindparam("reserve_delta")
+    result = db.execute(
+        update(inventory)
+        .where(inventory.c.product_id == bindparam("locked_product_id"), available >= 0, reserve >= 0)
+        .values(quantity_available=available, quantity_reserve=reserve),
+        rows
+    )
+    if db.get_bind().dialect.supports_sane_multi_rowcount and result.rowcount != len(rows):
+        raise ValueError("Inventory changed while reserving, please retry")
+
+def _record_stock_movements(db: Session, movements: List[dict]):
+    if movements:
+        db.execute(insert(Products.models.StockMovement), movements)
+
 def reserve_stock(db: Session, product_id: int, quantity: int) -> bool:
     """Reserve stock with proper transaction management"""
+    if hot_stock.is_hot(product_id):
+        change = hot_stock.apply([{"product_id": product_id, "quantity": quantity}], "reserve", "reserved")
+        hot_stock.commit(change)
+        return change.shortage is None
+
     try:
-        inventory = get_inventory_by_product_id(db, product_id)
-        if not inventory or inventory.quantity_available < quantity:
+        remaining = _reserve(db, product_id, quantity)
+        if remaining is None:
+            db.rollback()
             return False
-            
-        inventory.quantity_available -= quantity
-        inventory.quantity_reserve += quantity
-        
+
         movement = Products.models.StockMovement(
             product_id=product_id,
             change=-quantity,
@@ -200,29 +1019,48 @@ def reserve_stock(db: Session, product_id: int, quantity: int) -> bool:
         )
         db.add(movement)
         db.commit()
+        in_stock_sampler.update(product_id, remaining)
         return True
     except Exception as e:
         db.rollback()
         raise e
     
 def generate_recommendations(user_id: int, limit: int, db: Session) -> List[dict]:
-    products = db.query(Products.models.Product)\
-        .join(Products.models.Inventory)\
-        .filter(Products.models.Inventory.quantity_available > 0)\
-        .order_by(func.random())\
-        .limit(limit).all()
-    
-    return [
-        {
-            "id": p.id,
-            "name": p.name,
-            "price": float(p.price),
-            "brand": p.brand,
-            "category_name": p.category.name if p.category else "Unknown",
-            "rating": p.attributes.get("rating") if p.attributes else None,
-            "stock_quantity": p.inventory.quantity_available if p.inventory else 0
-        } for p in products
-    ]
+    """In-stock co-purchase neighbors of the user's recent purchases, topped up with random in-stock products"""
+    Product, Inventory, Neighbor = Products.models.Product, Products.models.Inventory, Products.models.ProductNeighbor
+    recent_orders = db.scalars(
+        select(Orders.models.Order.items)
+        .where(Orders.models.Order.user_id == user_id)
+        .order_by(Orders.models.Order.order_date.desc())
+        .limit(RECOMMENDATION_RECENT_ORDERS)
+    ).all()
+    purchased = {item["product_id"] for items in recent_orders for item in items or [] if item.get("product_id")}
+
+    product_ids: List[int] = []
+    if purchased:
+        score = func.sum(Neighbor.score).label("score")
+        product_ids = list(db.scalars(
+            select(Neighbor.neighbor_id)
+            .join(Inventory, Inventory.product_id == Neighbor.neighbor_id)
+            .where(
+                Neighbor.product_id.in_(purchased),
+                Neighbor.neighbor_id.notin_(purchased),
+                Inventory.quantity_available > 0
+            )
+            .group_by(Neighbor.neighbor_id)
+            .order_by(score.desc(), Neighbor.neighbor_id)
+            .limit(limit)
+        ))
+
+    # New users and products nobody bought alongside anything yet: random in-stock fillers
+    if len(product_ids) < limit:
+        product_ids += sample_in_stock_products(db, limit - len(product_ids), exclude=purchased | set(product_ids))
+
+    if not product_ids:
+        return []
+    rows = db.execute(_summary_projection(select(Product).where(Product.id.in_(product_ids)))).mappings().all()
+    by_id = {row["id"]: row for row in rows if row["stock_quantity"] > 0}
+    return [to_product_summary(by_id[product_id]) for product_id in product_ids if product_id in by_id]
 
 
 def reserve_products(
@@ -234,47 +1072,63 @@ def reserve_products(
     if isinstance(reservations, dict):
         reservations = [reservations]
     
+    reason = f"reserve_order_{cart_id}" if cart_id else "reserve"
+    # Hot products are decided in memory and only journaled once the database part commits
+    hot_items, reservations = hot_stock.split(reservations)
+    hot = hot_stock.apply(hot_items, "reserve", reason)
     try:
-        reserved_items = []
+        if hot.shortage:
+            item, available = hot.shortage
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Insufficient stock for product {item['product_id']} (requested: {item['quantity']}, available: {available})"
+            )
+        stock = _lock_inventories(db, [item["product_id"] for item in reservations])
+        before = {product_id: list(counts) for product_id, counts in stock.items()}
+        reserved_items = [{**item, "remaining_available": available} for item, available, _ in hot.applied]
         
         for item in reservations:
-            inventory = Products.crud.get_inventory_by_product_id(db, item["product_id"])
-            if not inventory or inventory.quantity_available < item["quantity"]:
+            counts = stock.get(item["product_id"])
+            if not counts or counts[0] < item["quantity"]:
                 db.rollback()
                 raise HTTPException(
                     status_code=400, 
-                    detail=f"Insufficient stock for product {item['product_id']} (requested: {item['quantity']}, available: {inventory.quantity_available if inventory else 0})"
+                    detail=f"Insufficient stock for product {item['product_id']} (requested: {item['quantity']}, available: {counts[0] if counts else 0})"
                 )
-        
-        for item in reservations:
-            inventory = Products.crud.get_inventory_by_product_id(db, item["product_id"])
-            inventory.quantity_available -= item["quantity"]
-            inventory.quantity_reserve += item["quantity"]
-            
-            movement = Products.models.StockMovement(
-                product_id=item["product_id"],
-                cart_id=item["cart_id"],
-                change=-item["quantity"],
-                reason=f"reserve_order_{cart_id}" if cart_id else "reserve"
-            )
-            db.add(movement)
+            counts[0] -= item["quantity"]
+            counts[1] += item["quantity"]
             reserved_items.append({
                 **item,
-                "remaining_available": inventory.quantity_available
+                "remaining_available": counts[0]
             })
         
+        _write_inventory_counts(db, before, stock)
+        _record_stock_movements(db, [
+            {
+                "product_id": item["product_id"],
+                "change": -item["quantity"],
+                "reason": reason
+            }
+            for item in reserved_items[len(hot.applied):]
+        ])
         db.commit()
-        
-        return {
-            "success": True,
-            "reserved_items": reserved_items,
-            "total_items": len(reserved_items),
-            "cart_id": cart_id,
-            "message": f"Successfully reserved {len(reserved_items)} product(s)"
-        }
     except Exception as e:
+        hot_stock.revert(hot)
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+
+    hot_stock.commit(hot)
+    for product_id, (available, _) in stock.items():
+        in_stock_sampler.update(product_id, available)
+    for item, available, _ in hot.applied:
+        in_stock_sampler.update(item["product_id"], available)
+    return {
+        "success": True,
+        "reserved_items": reserved_items,
+        "total_items": len(reserved_items),
+        "cart_id": cart_id,
+        "message": f"Successfully reserved {len(reserved_items)} product(s)"
+    }
     
 
 def release_products(
@@ -286,38 +1140,51 @@ def release_products(
     if isinstance(reservations, dict):
         reservations = [reservations]
     
+    reason = f"release_order_{cart_id}" if cart_id else "release"
+    hot_items, reservations = hot_stock.split(reservations)
+    hot = hot_stock.apply(hot_items, "release", reason)
     try:
-        released_items = []
+        stock = _lock_inventories(db, [item["product_id"] for item in reservations])
+        before = {product_id: list(counts) for product_id, counts in stock.items()}
+        released_items = [{**item, "new_available": available} for item, available, _ in hot.applied]
         
         for item in reservations:
-            inventory = Products.crud.get_inventory_by_product_id(db, item["product_id"])
-            if inventory and inventory.quantity_reserve >= item["quantity"]:
-                inventory.quantity_reserve -= item["quantity"]
-                inventory.quantity_available += item["quantity"]
-                
-                movement = Products.models.StockMovement(
-                    product_id=item["product_id"],
-                    cart_id=item["cart_id"],
-                    change=item["quantity"],
-                    reason=f"release_order_{cart_id}" if cart_id else "release"
-                )
-                db.add(movement)
+            counts = stock.get(item["product_id"])
+            if counts and counts[1] >= item["quantity"]:
+                counts[1] -= item["quantity"]
+                counts[0] += item["quantity"]
                 released_items.append({
                     **item,
-                    "new_available": inventory.quantity_available
+                    "new_available": counts[0]
                 })
         
+        _write_inventory_counts(db, before, stock)
+        _record_stock_movements(db, [
+            {
+                "product_id": item["product_id"],
+                "change": item["quantity"],
+                "reason": reason
+            }
+            for item in released_items[len(hot.applied):]
+        ])
         db.commit()
-        return {
-            "success": True,
-            "released_items": released_items,
-            "total_items": len(released_items),
-            "order_id": cart_id,
-            "message": f"Successfully released {len(released_items)} product(s)"
-        }
     except Exception as e:
+        hot_stock.revert(hot)
         db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
+
+    hot_stock.commit(hot)
+    for product_id, (available, _) in stock.items():
+        in_stock_sampler.update(product_id, available)
+    for item, available, _ in hot.applied:
+        in_stock_sampler.update(item["product_id"], available)
+    return {
+        "success": True,
+        "released_items": released_items,
+        "total_items": len(released_items),
+        "order_id": cart_id,
+        "message": f"Successfully released {len(released_items)} product(s)"
+    }
     
 def finalize_products(
     reservations: Union[List[dict], dict],
@@ -328,34 +1195,44 @@ def finalize_products(
     if isinstance(reservations, dict):
         reservations = [reservations]
     
+    reason = f"finalize_order_{order_id}" if order_id else "finalize"
+    hot_items, reservations = hot_stock.split(reservations)
+    hot = hot_stock.apply(hot_items, "finalize", reason, order_id)
     try:
-        finalized_items = []
+        stock = _lock_inventories(db, [item["product_id"] for item in reservations])
+        before = {product_id: list(counts) for product_id, counts in stock.items()}
+        finalized_items = [{**item, "remaining_reserved": reserved} for item, _, reserved in hot.applied]
         
         for item in reservations:
-            inventory = Products.crud.get_inventory_by_product_id(db, item["product_id"])
-            if inventory and inventory.quantity_reserve >= item["quantity"]:
-                inventory.quantity_reserve -= item["quantity"]
-                
-                movement = Products.models.StockMovement(
-                    product_id=item["product_id"],
-                    order_id=item["order_id"],
-                    change=-item["quantity"],
-                    reason=f"finalize_order_{order_id}" if order_id else "finalize"
-                )
-                db.add(movement)
+            counts = stock.get(item["product_id"])
+            if counts and counts[1] >= item["quantity"]:
+                counts[1] -= item["quantity"]
                 finalized_items.append({
                     **item,
-                    "remaining_reserved": inventory.quantity_reserve
+                    "remaining_reserved": counts[1]
                 })
         
+        _write_inventory_counts(db, before, stock)
+        _record_stock_movements(db, [
+            {
+                "product_id": item["product_id"],
+                "order_id": order_id,
+                "change": -item["quantity"],
+                "reason": reason
+            }
+            for item in finalized_items[len(hot.applied):]
+        ])
         db.commit()
-        return {
-            "success": True,
-            "finalized_items": finalized_items,
-            "total_items": len(finalized_items),
-            "order_id": order_id,
-            "message": f"Successfully finalized {len(finalized_items)} product(s)"
-        }
     except Exception as e:
+        hot_stock.revert(hot)
         db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+    hot_stock.commit(hot)
+    return {
+        "success": True,
+        "finalized_items": finalized_items,
+        "total_items": len(finalized_items),
+        "order_id": order_id,
+        "message": f"Successfully finalized {len(finalized_items)} product(s)"
+    }
@@ -0,0 +1,107 @@
+from typing import Any, Dict, Iterator, List, Optional
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import Select, func, select, union
+from database import ReadSessionLocal
+import Products.models
+import csv
+import io
+import json
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+PRODUCT_EXPORT_COLUMNS = [
+    "id", "name", "price", "brand", "category_id", "category_name", "attributes",
+    "quantity_available", "quantity_reserve", "created_at", "updated_at", "inventory_updated_at"
+]
+STOCK_MOVEMENT_EXPORT_COLUMNS = ["id", "product_id", "order_id", "change", "reason", "timestamp"]
+
+
+def _as_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def product_export_query(updated_since: Optional[datetime] = None) -> Select:
+    Product, Inventory, Category = Products.models.Product, Products.models.Inventory, Products.models.Category
+    query = (
+        select(
+            Product.id,
+            Product.name,
+            Product.price,
+            Product.brand,
+            Product.category_id,
+            Category.name.label("category_name"),
+            Product.attributes,
+            func.coalesce(Inventory.quantity_available, 0).label("quantity_available"),
+            func.coalesce(Inventory.quantity_reserve, 0).label("quantity_reserve"),
+            Product.created_at,
+            Product.updated_at,
+            Inventory.last_updated.label("inventory_updated_at")
+        )
+        .outerjoin(Category, Category.id == Product.category_id)
+        .outerjoin(Inventory, Inventory.product_id == Product.id)
+        .order_by(Product.id)
+    )
+    if updated_since is not None:
+        since = _as_utc_naive(updated_since)
+        # One indexed range scan per timestamp, deduplicated by the UNION; an OR across
+        # the outer join would leave the database nothing but a full scan
+        changed = union(
+            select(Product.id.label("product_id")).where(Product.created_at >= since),
+            select(Product.id).where(Product.updated_at >= since),
+            select(Inventory.product_id).where(Inventory.last_updated >= since)
+        ).subquery("changed")
+        query = query.join(changed, changed.c.product_id == Product.id)
+    return query
+
+def stock_movement_export_query(updated_since: Optional[datetime] = None, product_id: Optional[int] = None) -> Select:
+    StockMovement = Products.models.StockMovement
+    query = select(*[getattr(StockMovement, column) for column in STOCK_MOVEMENT_EXPORT_COLUMNS]).order_by(StockMovement.id)
+    if updated_since is not None:
+        query = query.where(StockMovement.timestamp >= _as_utc_naive(updated_since))
+    if product_id is not None:
+        query = query.where(StockMovement.product_id == product_id)
+    return query
+
+def _format_batch(rows: List[Dict[str, Any]], columns: List[str], fmt: str) -> str:
+    if fmt == "ndjson":
+        return "".join(json.dumps({column: _plain(row[column]) for column in columns}) + "\n" for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            json.dumps(row[column]) if isinstance(row[column], (dict, list)) else _plain(row[column])
+            for column in columns
+        ])
+    return buffer.getvalue()
+
+def stream_export(query: Select, columns: List[str], fmt: str, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """Stream query rows as NDJSON/CSV, one chunk per fetched batch.
+
+    The session is opened here rather than taken from a dependency: the body is
+    produced after the endpoint returns, and it reads through a server-side cursor.
+    """
+    if fmt == "csv":
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        yield header.getvalue()
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for partition in result.mappings().partitions():
+            yield _format_batch(partition, columns, fmt)
+    finally:
+        db.close()
@@ -0,0 +1,268 @@
+from threading import Lock
+from typing import Collection, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+import Products.models
+import json
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Opt-in: comma separated product ids whose counters live in memory, e.g. "12,345".
+# The counters are per process, so this is for single-worker deployments only: a
+# second worker would sell the same units again, and it fails at startup instead.
+HOT_STOCK_PRODUCT_IDS = [
+    int(product_id) for product_id in os.getenv("HOT_STOCK_PRODUCT_IDS", "").split(",") if product_id.strip()
+]
+HOT_STOCK_FLUSH_SECONDS = int(os.getenv("HOT_STOCK_FLUSH_SECONDS", "1"))
+HOT_STOCK_JOURNAL = os.getenv("HOT_STOCK_JOURNAL", "hot_stock.journal")
+
+# mode -> (sign of the available delta, sign of the reserve delta, counter that must cover the quantity)
+MODES = {
+    "reserve": (-1, 1, 0),
+    "release": (1, -1, 1),
+    "finalize": (0, -1, 1),
+}
+
+
+class HotStockChange:
+    """Counter moves made by HotStockStore.apply, held until the caller commits or reverts them"""
+
+    def __init__(self):
+        self.entries: List[dict] = []
+        self.applied: List[Tuple[dict, int, int]] = []
+        self.shortage: Optional[Tuple[dict, int]] = None
+
+
+class HotStockStore:
+    """Available/reserved counters for designated hot products, decided in memory and written behind.
+
+    Committed changes are appended to a local journal before they are acknowledged,
+    and flush() writes the net deltas, the StockMovement rows and the journal position
+    to the database in one transaction. After a crash, load() replays the journal
+    entries past that checkpoint. The counters belong to this process, which holds
+    an exclusive lock on the journal from load() on, so a second process on the same
+    journal fails instead of overwriting it; the journal survives a process crash,
+    not a lost disk.
+    """
+
+    def __init__(self, journal_path: str = HOT_STOCK_JOURNAL):
+        self.journal_path = journal_path
+        self.journal_key = os.path.basename(journal_path)
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._counters: Dict[int, List[int]] = {}
+        self._pending: List[dict] = []
+        self._seq = 0
+        self._journal = None
+        self._owner = None
+        self.ready = False
+
+    def is_hot(self, product_id: int) -> bool:
+        return product_id in self._counters
+
+    def split(self, items: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """(hot items, items left for the database)"""
+        hot = [item for item in items if item["product_id"] in self._counters]
+        return hot, [item for item in items if item["product_id"] not in self._counters]
+
+    def apply(self, items: List[dict], mode: str, reason: str, order_id: Optional[str] = None) -> HotStockChange:
+        """Move the counters for items; nothing is journaled until commit(), and revert() undoes it.
+
+        A reserve is all or nothing: the first item that can't be covered is reported
+        as the shortage and no counter moves. Release and finalize skip such items.
+        """
+        available_sign, reserve_sign, guard = MODES[mode]
+        change = HotStockChange()
+        with self._lock:
+            for item in items:
+                counts = self._counters[item["product_id"]]
+                quantity = item["quantity"]
+                if counts[guard] < quantity:
+                    if mode == "reserve":
+                        self._undo(change.entries)
+                        change.entries, change.applied = [], []
+                        change.shortage = (item, counts[0])
+                        break
+                    continue
+                counts[0] += available_sign * quantity
+                counts[1] += reserve_sign * quantity
+                change.entries.append({
+                    "product_id": item["product_id"],
+                    "available_delta": available_sign * quantity,
+                    "reserve_delta": reserve_sign * quantity,
+                    "change": quantity if mode == "release" else -quantity,
+                    "reason": reason,
+                    "order_id": order_id
+                })
+                change.applied.append((item, counts[0], counts[1]))
+        return change
+
+    def commit(self, change: HotStockChange):
+        """Journal the change and queue it for the next flush"""
+        if not change.entries:
+            return
+        with self._lock:
+            lines = []
+            for entry in change.entries:
+                self._seq += 1
+                entry["seq"] = self._seq
+                lines.append(json.dumps(entry) + "\n")
+            self._journal.write("".join(lines))
+            self._journal.flush()
+            self._pending.extend(change.entries)
+
+    def revert(self, change: HotStockChange):
+        with self._lock:
+            self._undo(change.entries)
+        change.entries, change.applied = [], []
+
+    def _undo(self, entries: List[dict]):
+        for entry in entries:
+            counts = self._counters[entry["product_id"]]
+            counts[0] -= entry["available_delta"]
+            counts[1] -= entry["reserve_delta"]
+
+    def _write_entries(self, db: Session, entries: List[dict]):
+        deltas: Dict[int, List[int]] = {}
+        for entry in entries:
+            delta = deltas.setdefault(entry["product_id"], [0, 0])
+            delta[0] += entry["available_delta"]
+            delta[1] += entry["reserve_delta"]
+        rows = [
+            {"hot_product_id": product_id, "available_delta": available, "reserve_delta": reserve}
+            for product_id, (available, reserve) in sorted(deltas.items()) if available or reserve
+        ]
+        if rows:
+            inventory = Products.models.Inventory.__table__
+            db.execute(
+                update(inventory)
+                .where(inventory.c.product_id == bindparam("hot_product_id"))
+                .values(
+                    quantity_available=inventory.c.quantity_available + bindparam("available_delta"),
+                    quantity_reserve=inventory.c.quantity_reserve + bindparam("reserve_delta")
+                ),
+                rows
+            )
+        db.execute(insert(Products.models.StockMovement), [
+            {key: entry[key] for key in ("product_id", "order_id", "change", "reason")} for entry in entries
+        ])
+        db.merge(Products.models.HotStockCheckpoint(journal=self.journal_key, last_seq=entries[-1]["seq"]))
+
+    def flush(self, db: Session) -> int:
+        """Write everything journaled so far to the database; the number of movements written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            try:
+                self._write_entries(db, pending)
+                db.commit()
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    self._pending = pending + self._pending
+                raise
+            with self._lock:
+                self._rewrite_journal(self._pending)
+            return len(pending)
+
+    def _read_journal(self) -> List[dict]:
+        if not os.path.exists(self.journal_path):
+            return []
+        entries = []
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break  # a torn last line from a crash mid-write was never acknowledged
+        return entries
+
+    def _rewrite_journal(self, entries: List[dict]):
+        # Only entries not yet in the database are kept; the swap is atomic on disk
+        if self._journal:
+            self._journal.close()
+        temporary = self.journal_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as journal:
+            journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        os.replace(temporary, self.journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _claim_journal(self):
+        """Lock the journal for this process's lifetime; RuntimeError if another process holds it"""
+        if self._owner:
+            return
+        owner = open(self.journal_path + ".lock", "a+")
+        try:
+            if fcntl:
+                fcntl.flock(owner.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                owner.seek(0)
+                msvcrt.locking(owner.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            owner.close()
+            raise RuntimeError(
+                f"Hot stock journal {self.journal_path} is owned by another process; "
+                "HOT_STOCK_PRODUCT_IDS needs a single worker"
+            )
+        self._owner = owner
+
+    def load(self, db: Session, product_ids: Collection[int]):
+        """Replay journal entries the database hasn't seen, then take the counters for product_ids from it"""
+        self._claim_journal()
+        if self.ready:
+            self.flush(db)
+        with self._flush_lock:
+            checkpoint = db.get(Products.models.HotStockCheckpoint, self.journal_key)
+            last_seq = checkpoint.last_seq if checkpoint else 0
+            unflushed = [entry for entry in self._read_journal() if entry["seq"] > last_seq]
+            if unflushed:
+                try:
+                    self._write_entries(db, unflushed)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+            Inventory = Products.models.Inventory
+            rows = db.execute(
+                select(Inventory.product_id, Inventory.quantity_available, Inventory.quantity_reserve)
+                .where(Inventory.product_id.in_(list(product_ids)))
+            )
+            with self._lock:
+                self._counters = {product_id: [available or 0, reserve or 0] for product_id, available, reserve in rows}
+                self._pending = []
+                self._seq = max([last_seq] + [entry["seq"] for entry in unflushed])
+                self._rewrite_journal([])
+                self.ready = True
+        return len(unflushed)
+
+    def refresh(self, db: Session, product_id: int):
+        """Re-read one hot product after its inventory row was edited directly"""
+        if product_id not in self._counters:
+            return
+        with self._flush_lock:
+            Inventory = Products.models.Inventory
+            row = db.execute(
+                select(Inventory.quantity_available, Inventory.quantity_reserve).where(Inventory.product_id == product_id)
+            ).one_or_none()
+            with self._lock:
+                if row is None:
+                    self._counters.pop(product_id, None)
+                    return
+                # Changes still waiting for a flush are on top of what the row says
+                counts = [row.quantity_available or 0, row.quantity_reserve or 0]
+                for entry in self._pending:
+                    if entry["product_id"] == product_id:
+                        counts[0] += entry["available_delta"]
+                        counts[1] += entry["reserve_delta"]
+                self._counters[product_id] = counts
+
+
+hot_stock = HotStockStore()
@@ -0,0 +1,236 @@
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from Products.categories import category_tree
+from Products.crud import invalidate_listing_caches
+from Products.sampler import in_stock_sampler
+from Products.search import product_search_index
+import Products.models, Products.schemas
+import csv
+import json
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_FORMATS = ("ndjson", "csv")
+
+PRODUCT_FIELDS = tuple(Products.schemas.ProductCreate.model_fields)
+INVENTORY_FIELDS = tuple(
+    field for field in Products.schemas.ProductImportRow.model_fields if field not in PRODUCT_FIELDS
+)
+
+
+class ImportReport:
+    def __init__(self, max_errors: int = IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.received = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def fail(self, line: int, error: str):
+        # Only the first max_errors are kept so a bad file can't grow the report without bound
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": error})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
+
+
+def _decode(line: bytes, number: int) -> Tuple[str, Optional[str]]:
+    """(text, error); undecodable bytes are replaced so the line can still be reported as a row error"""
+    encoding = "utf-8-sig" if number == 1 else "utf-8"
+    try:
+        return line.decode(encoding), None
+    except UnicodeDecodeError as e:
+        return line.decode(encoding, errors="replace"), f"not valid UTF-8 ({e.reason} at byte {e.start})"
+
+async def _iter_physical_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str, Optional[str]]]:
+    """(line number, text without the newline, decode error) for every line of a streamed body"""
+    buffer = b""
+    number = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield (number, *_decode(line, number))
+    if buffer:
+        yield (number + 1, *_decode(buffer, number + 1))
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str, Optional[str]]]:
+    """(line number, text, decode error) for each non-blank line of a streamed body"""
+    async for number, text, error in _iter_physical_lines(stream):
+        text = text.strip()
+        if text:
+            yield number, text, error
+
+class _LineFeed:
+    """Lines handed to one csv.reader as they arrive; the reader is only advanced over complete records"""
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+async def iter_csv(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+    """(first line number, values, error) for each non-blank CSV record of a streamed body.
+
+    One csv.reader parses the whole stream, so quoted fields may span lines; a
+    record is complete once its quotes balance. values is None when error is set.
+    """
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    start, quotes, error = None, 0, None
+    async for number, text, decode_error in _iter_physical_lines(stream):
+        if start is None:
+            if not text.strip():
+                continue
+            start = number
+        feed.lines.append(text + "\n")
+        quotes += text.count('"')
+        error = error or decode_error
+        if quotes % 2:
+            continue
+        try:
+            values = next(reader)
+        except csv.Error as e:
+            values, error = None, error or str(e)
+        feed.lines.clear()
+        yield start, None if error else values, error
+        start, quotes, error = None, 0, None
+    if start is not None:
+        yield start, None, "unterminated quoted field"
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+    )
+
+def _csv_record(header: List[str], values: List[str]) -> Dict[str, Any]:
+    if len(values) != len(header):
+        raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+    # Empty cells fall back to the schema defaults; attributes are a JSON object
+    record = {column: value for column, value in zip(header, values) if value != ""}
+    if "attributes" in record:
+        record["attributes"] = json.loads(record["attributes"])
+    return record
+
+def _insert_products(db: Session, rows: List[Products.schemas.ProductImportRow]) -> List[int]:
+    product_rows = [row.model_dump(include=set(PRODUCT_FIELDS)) for row in rows]
+    dialect = db.get_bind().dialect
+    # Core inserts skip the model's attribute validator, so fill the shadow columns here
+    values = [{**product_row, **Products.models.promoted_values(product_row["attributes"])} for product_row in product_rows]
+    # Batched INSERT .. RETURNING keeps ids aligned with rows
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        return list(db.scalars(
+            insert(Products.models.Product).returning(Products.models.Product.id, sort_by_parameter_order=True),
+            values
+        ))
+    # MySQL has no RETURNING: one multi-row INSERT is a "simple insert", for which InnoDB
+    # hands out consecutive ids in every auto-increment lock mode, and LAST_INSERT_ID()
+    # is the first of them (assumes the default auto_increment_increment of 1)
+    if dialect.name in ("mysql", "mariadb"):
+        result = db.execute(insert(Products.models.Product).values(values))
+        if result.rowcount != len(values):
+            raise RuntimeError(f"inserted {result.rowcount} of {len(values)} products")
+        return list(range(result.lastrowid, result.lastrowid + len(values)))
+    products = [Products.models.Product(**product_row) for product_row in product_rows]
+    db.add_all(products)
+    db.flush()
+    return [product.id for product in products]
+
+def write_chunk(db: Session, rows: List[Products.schemas.ProductImportRow]) -> List[int]:
+    """Insert one chunk of products and their inventory rows in a single transaction"""
+    product_ids = _insert_products(db, rows)
+    db.execute(insert(Products.models.Inventory), [
+        {"product_id": product_id, **row.model_dump(include=set(INVENTORY_FIELDS))}
+        for product_id, row in zip(product_ids, rows)
+    ])
+    db.commit()
+    return product_ids
+
+async def _flush_chunk(db: AsyncSession, chunk: List[Tuple[int, Products.schemas.ProductImportRow]], report: ImportReport):
+    rows = [row for _, row in chunk]
+    try:
+        product_ids = await db.run_sync(write_chunk, rows)
+    except Exception as e:
+        await db.rollback()
+        for line, _ in chunk:
+            report.fail(line, f"batch rejected: {e.__class__.__name__}: {e}")
+        return
+    report.imported += len(product_ids)
+    for product_id, row in zip(product_ids, rows):
+        product_search_index.upsert(product_id, row.name, row.brand, row.attributes)
+        in_stock_sampler.update(product_id, row.quantity_available)
+
+async def import_products(
+    db: AsyncSession,
+    stream: AsyncIterator[bytes],
+    fmt: str = "ndjson",
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    max_errors: int = IMPORT_MAX_ERRORS
+) -> dict:
+    """Validate and insert a streamed NDJSON/CSV body chunk by chunk; memory stays at one chunk"""
+    report = ImportReport(max_errors)
+    if not category_tree.ready:
+        await db.run_sync(category_tree.load)
+
+    header: Optional[List[str]] = None
+    chunk: List[Tuple[int, Products.schemas.ProductImportRow]] = []
+    # NDJSON rows are text, CSV rows are already split into values
+    rows = iter_csv(stream) if fmt == "csv" else iter_lines(stream)
+    async for line, value, error in rows:
+        if fmt == "csv" and header is None:
+            if error:
+                report.fail(line, f"unparseable header: {error}")
+                break
+            header = [column.strip() for column in value]
+            continue
+        report.received += 1
+        if error:
+            report.fail(line, f"unparseable row: {error}")
+            continue
+        try:
+            record = _csv_record(header, value) if fmt == "csv" else json.loads(value)
+            if not isinstance(record, dict):
+                raise ValueError("row must be a JSON object")
+            row = Products.schemas.ProductImportRow.model_validate(record)
+        except ValidationError as e:
+            report.fail(line, _validation_message(e))
+            continue
+        except ValueError as e:
+            report.fail(line, f"unparseable row: {e}")
+            continue
+        if not category_tree.has(row.category_id):
+            report.fail(line, f"category_id: unknown category {row.category_id}")
+            continue
+
+        chunk.append((line, row))
+        if len(chunk) >= chunk_size:
+            await _flush_chunk(db, chunk, report)
+            chunk = []
+
+    if chunk:
+        await _flush_chunk(db, chunk, report)
+    if report.imported:
+        invalidate_listing_caches()
+    return report.as_dict()
@@ -1,7 +1,7 @@
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, JSON, DateTime, Numeric
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, JSON, DateTime, Numeric, Index
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.sql import func, text
 from database import Base
 from datetime import datetime, timezone
 import sys
@@ -11,20 +11,53 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 def utc_now():
     return datetime.now(timezone.utc)
 
+# Attributes copied out of the JSON into indexed columns: attribute -> (column, kind)
+PROMOTED_ATTRIBUTES = {
+    "color": ("attr_color", "text"),
+    "material": ("attr_material", "text"),
+    "rating": ("attr_rating", "number"),
+}
+
+def promoted_values(attributes: Optional[dict]) -> dict:
+    """Shadow column values for an attributes dict; text is lowercased, missing values are None"""
+    attributes = attributes or {}
+    values = {}
+    for name, (column, kind) in PROMOTED_ATTRIBUTES.items():
+        value = attributes.get(name)
+        if kind == "number":
+            try:
+                values[column] = float(value) if value is not None else None
+            except (TypeError, ValueError):
+                values[column] = None
+        else:
+            values[column] = str(value).strip().lower()[:50] if value not in (None, "") else None
+    return values
+
 class Category(Base):
     __tablename__ = "categories"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False, index=True)
-    parent_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
+    parent_id = Column(Integer, ForeignKey('categories.id'), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped by every UPDATE; timestamps alone can't tell apart writes within one second
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
 
     parent = relationship("Category", remote_side=[id], back_populates="children")
     children = relationship("Category", back_populates="parent", cascade="all, delete-orphan")
     products = relationship("Product", back_populates="category", cascade="all, delete-orphan")
 
 
+class CategoryClosure(Base):
+    """Every (ancestor, descendant) pair of the category tree, including each category with itself"""
+    __tablename__ = "category_closure"
+
+    ancestor_id = Column(Integer, ForeignKey('categories.id', ondelete="CASCADE"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('categories.id', ondelete="CASCADE"), primary_key=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
+
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -33,15 +66,27 @@ class Product(Base):
     price = Column(Numeric(10, 2), nullable=False, index=True)
     brand = Column(String(100), index=True)
     attributes = Column(JSON, nullable=True)
-    category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    category_id = Column(Integer, ForeignKey('categories.id'), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=text("version + 1"))
+
+    # Promoted attributes; NULL means the product doesn't have the attribute
+    attr_color = Column(String(50), index=True)
+    attr_material = Column(String(50), index=True)
+    attr_rating = Column(Float, nullable=True, index=True)
 
     category = relationship("Category", back_populates="products")
     price_history = relationship("PriceHistory", back_populates="product", cascade="all, delete-orphan")
     inventory = relationship("Inventory", back_populates="product", uselist=False, cascade="all, delete-orphan")
     stock_movements = relationship("StockMovement", back_populates="product", cascade="all, delete-orphan")
 
+    @validates("attributes")
+    def sync_promoted_attributes(self, key, attributes):
+        for column, value in promoted_values(attributes).items():
+            setattr(self, column, value)
+        return attributes
+
 
 class PriceHistory(Base):
     __tablename__ = "product_history"
@@ -55,6 +100,10 @@ class PriceHistory(Base):
 
     product = relationship("Product", back_populates="price_history")
 
+    __table_args__ = (
+        Index("ix_product_history_product_changed", "product_id", "changed_at"),
+    )
+
 class Inventory(Base):
     __tablename__ = "inventory"
 
@@ -69,7 +118,7 @@ class Inventory(Base):
     expiry_date = Column(DateTime, nullable=True)
     batch_number = Column(String(100), nullable=True)
     location = Column(String(100), nullable=True)
-    last_updated = Column(DateTime, default=utc_now, onupdate=utc_now)
+    last_updated = Column(DateTime, default=utc_now, onupdate=utc_now, index=True)
 
     product = relationship("Product", back_populates="inventory")
 
@@ -79,12 +128,28 @@ class StockMovement(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    order_id = Column(Integer, nullable=True)
     change = Column(Integer, nullable=False)
     reason = Column(String(255), nullable=True)
-    timestamp = Column(DateTime, default=utc_now)
+    timestamp = Column(DateTime, default=utc_now, index=True)
 
     product = relationship("Product", back_populates="stock_movements")
 
 
+class ProductNeighbor(Base):
+    """Top-K co-purchased products per product, rebuilt offline from order history"""
+    __tablename__ = "product_neighbors"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+
 
+class HotStockCheckpoint(Base):
+    """Last write-behind journal entry flushed to inventory, one row per journal"""
+    __tablename__ = "hot_stock_checkpoints"
 
+    journal = Column(String(255), primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=0)
+    flushed_at = Column(DateTime, default=utc_now, onupdate=utc_now)
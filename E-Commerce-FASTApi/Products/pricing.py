@@ -0,0 +1,175 @@
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from Products.categories import category_tree
+from Products.crud import in_category_tree, invalidate_product_caches
+from Products.importer import iter_csv
+import numpy as np
+import Products.models, Products.schemas
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+REPRICE_CHUNK_SIZE = int(os.getenv("REPRICE_CHUNK_SIZE", "5000"))
+REPRICE_MAX_ERRORS = 1000
+MIN_PRICE = 0.01
+
+
+class RepriceStats:
+    def __init__(self):
+        self.matched = 0
+        self.updated = 0
+        self.not_found: List[int] = []
+        self.failed: List[str] = []
+
+    def fail(self, message: str):
+        if len(self.failed) < REPRICE_MAX_ERRORS:
+            self.failed.append(message)
+
+    def as_dict(self) -> dict:
+        return {
+            "matched": self.matched,
+            "updated": self.updated,
+            "unchanged": self.matched - self.updated,
+            "not_found": self.not_found[:REPRICE_MAX_ERRORS],
+            "failed": self.failed
+        }
+
+
+def _apply_chunk(db: Session, ids: np.ndarray, old: np.ndarray, new: np.ndarray, reason: str, stats: RepriceStats):
+    """Write one chunk's changed prices and their history rows in a single transaction"""
+    stats.matched += len(ids)
+    changed = np.abs(new - old) >= 0.005
+    if not changed.any():
+        return
+    ids, old, new = ids[changed].tolist(), old[changed].tolist(), new[changed].tolist()
+    try:
+        db.execute(update(Products.models.Product), [
+            {"id": product_id, "price": price} for product_id, price in zip(ids, new)
+        ])
+        db.execute(insert(Products.models.PriceHistory), [
+            {"product_id": product_id, "old_price": old_price, "new_price": new_price, "reason": reason}
+            for product_id, old_price, new_price in zip(ids, old, new)
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_product_caches(*ids)
+    stats.updated += len(ids)
+
+def _new_prices(old: np.ndarray, percents) -> np.ndarray:
+    # Work in cents and round half up, so float noise can't decide which way x.xx5 goes
+    cents = np.rint(old * 100) * (1 + np.asarray(percents, dtype=np.float64) / 100)
+    return np.maximum(np.floor(cents + 0.5 + 1e-6) / 100, MIN_PRICE)
+
+def _category_percent_map(db: Session, category_percentages: Dict[int, float]) -> Dict[int, float]:
+    """Expand each category to its subtree; a more specific category's percentage wins"""
+    if not category_tree.ready:
+        category_tree.load(db)
+    unknown = sorted(category_id for category_id in category_percentages if not category_tree.has(category_id))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid category_id: {unknown}")
+    percent_by_category: Dict[int, float] = {}
+    for category_id, percent in sorted(
+        category_percentages.items(), key=lambda entry: -len(category_tree.descendant_ids(entry[0]))
+    ):
+        for descendant_id in category_tree.descendant_ids(category_id):
+            percent_by_category[descendant_id] = percent
+    return percent_by_category
+
+def reprice_by_rule(db: Session, rule: Products.schemas.PriceUpdateRule, chunk_size: int = REPRICE_CHUNK_SIZE) -> dict:
+    """Walk the matching products in id order, chunk by chunk, computing each chunk's prices as arrays"""
+    if (rule.percent is None) == (rule.category_percentages is None):
+        raise HTTPException(status_code=400, detail="Give either percent or category_percentages")
+
+    Product = Products.models.Product
+    query = select(Product.id, Product.price, Product.category_id)
+    percent_by_category: Optional[Dict[int, float]] = None
+    if rule.category_percentages is not None:
+        percent_by_category = _category_percent_map(db, rule.category_percentages)
+        query = query.where(Product.category_id.in_(list(percent_by_category)))
+    elif rule.category_id is not None:
+        query = query.where(in_category_tree(rule.category_id))
+    if rule.brand:
+        query = query.where(Product.brand == rule.brand)
+
+    stats = RepriceStats()
+    last_id = 0
+    while True:
+        rows = db.execute(query.where(Product.id > last_id).order_by(Product.id).limit(chunk_size)).all()
+        if not rows:
+            break
+        ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        old = np.fromiter((float(row.price) for row in rows), dtype=np.float64, count=len(rows))
+        if percent_by_category is not None:
+            categories, positions = np.unique(
+                np.fromiter((row.category_id for row in rows), dtype=np.int64, count=len(rows)), return_inverse=True
+            )
+            percents = np.array([percent_by_category[int(category_id)] for category_id in categories])[positions]
+        else:
+            percents = rule.percent
+        _apply_chunk(db, ids, old, _new_prices(old, percents), rule.reason, stats)
+        last_id = rows[-1].id
+
+    return stats.as_dict()
+
+def _reprice_explicit(db: Session, prices: Dict[int, float], reason: str, stats: RepriceStats):
+    rows = db.execute(
+        select(Products.models.Product.id, Products.models.Product.price)
+        .where(Products.models.Product.id.in_(list(prices)))
+        .order_by(Products.models.Product.id)
+    ).all()
+    stats.not_found.extend(sorted(prices.keys() - {row.id for row in rows}))
+    if not rows:
+        return
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    old = np.fromiter((float(row.price) for row in rows), dtype=np.float64, count=len(rows))
+    new = np.round(np.fromiter((prices[row.id] for row in rows), dtype=np.float64, count=len(rows)), 2)
+    _apply_chunk(db, ids, old, new, reason, stats)
+
+def _price_columns(header: List[str]) -> Optional[tuple]:
+    columns = [column.strip().lower() for column in header]
+    id_column = next((columns.index(name) for name in ("product_id", "id") if name in columns), None)
+    price_column = next((columns.index(name) for name in ("new_price", "price") if name in columns), None)
+    if id_column is None or price_column is None:
+        return None
+    return id_column, price_column
+
+async def reprice_from_csv(
+    db: AsyncSession,
+    stream: AsyncIterator[bytes],
+    reason: str = "price list import",
+    chunk_size: int = REPRICE_CHUNK_SIZE
+) -> dict:
+    """Apply a streamed product_id,price CSV (header optional); later lines for an id win"""
+    stats = RepriceStats()
+    columns = (0, 1)
+    chunk: Dict[int, float] = {}
+    first = True
+    async for line, values, error in iter_csv(stream):
+        if first and values and _price_columns(values):
+            columns = _price_columns(values)
+            first = False
+            continue
+        first = False
+        if error:
+            stats.fail(f"line {line}: {error}")
+            continue
+        try:
+            product_id, price = int(values[columns[0]]), float(values[columns[1]])
+            if price < MIN_PRICE:
+                raise ValueError(f"price must be at least {MIN_PRICE}")
+        except (ValueError, IndexError) as e:
+            stats.fail(f"line {line}: {e}")
+            continue
+        chunk[product_id] = price
+        if len(chunk) >= chunk_size:
+            await db.run_sync(_reprice_explicit, chunk, reason, stats)
+            chunk = {}
+    if chunk:
+        await db.run_sync(_reprice_explicit, chunk, reason, stats)
+
+    return stats.as_dict()
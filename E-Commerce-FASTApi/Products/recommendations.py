@@ -0,0 +1,91 @@
+from typing import Dict, List
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from scipy import sparse
+import numpy as np
+import Products.models
+import Orders.models
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+NEIGHBOR_INSERT_BATCH = 5000
+
+
+def _order_product_matrix(db: Session, batch_size: int = 5000):
+    """Binary orders x products matrix from Order.items, plus the product id of each column"""
+    rows: List[int] = []
+    product_ids: List[int] = []
+    result = db.execute(
+        select(Orders.models.Order.items)
+        .where(Orders.models.Order.status != Orders.models.OrderStatus.canceled)
+        .execution_options(yield_per=batch_size)
+    )
+    order_index = 0
+    for (items,) in result:
+        basket = {item["product_id"] for item in items or [] if item.get("product_id") is not None}
+        if len(basket) < 2:
+            continue  # a single-item order co-occurs with nothing
+        rows.extend([order_index] * len(basket))
+        product_ids.extend(basket)
+        order_index += 1
+
+    columns, column_ids = np.unique(np.asarray(product_ids, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (np.asarray(rows, dtype=np.int64), column_ids)),
+        shape=(order_index, len(columns))
+    )
+    return matrix, columns
+
+def co_purchase_neighbors(db: Session, top_k: int = RECOMMENDATION_TOP_K) -> Dict[int, List[tuple]]:
+    """product_id -> [(neighbor_id, score)] ranked by cosine similarity of their order vectors"""
+    matrix, product_ids = _order_product_matrix(db)
+    if matrix.shape[0] == 0:
+        return {}
+
+    co_counts = (matrix.T @ matrix).tocsr()
+    purchases = co_counts.diagonal()
+    co_counts.setdiag(0)
+    co_counts.eliminate_zeros()
+    # cosine: co_count(i, j) / sqrt(orders(i) * orders(j))
+    inverse_norm = sparse.diags(1.0 / np.sqrt(np.maximum(purchases, 1)))
+    similarity = (inverse_norm @ co_counts @ inverse_norm).tocsr()
+
+    neighbors: Dict[int, List[tuple]] = {}
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        columns = similarity.indices[start:end]
+        if len(scores) > top_k:
+            keep = np.argpartition(-scores, top_k)[:top_k]
+            scores, columns = scores[keep], columns[keep]
+        order = np.lexsort((product_ids[columns], -scores))
+        neighbors[int(product_ids[row])] = [
+            (int(product_ids[columns[index]]), float(scores[index])) for index in order
+        ]
+    return neighbors
+
+def rebuild_neighbor_table(db: Session, top_k: int = RECOMMENDATION_TOP_K) -> int:
+    """Recompute the model and swap the neighbor table contents in one transaction"""
+    neighbors = co_purchase_neighbors(db, top_k)
+    # Orders keep ids of products that may since have been deleted
+    existing = set(db.scalars(select(Products.models.Product.id)))
+    rows = [
+        {"product_id": product_id, "rank": rank, "neighbor_id": neighbor_id, "score": score}
+        for product_id, ranked in neighbors.items() if product_id in existing
+        for rank, (neighbor_id, score) in enumerate(
+            [neighbor for neighbor in ranked if neighbor[0] in existing]
+        )
+    ]
+    try:
+        db.execute(delete(Products.models.ProductNeighbor))
+        for start in range(0, len(rows), NEIGHBOR_INSERT_BATCH):
+            db.execute(insert(Products.models.ProductNeighbor), rows[start:start + NEIGHBOR_INSERT_BATCH])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
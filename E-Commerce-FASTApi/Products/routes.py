@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy import desc, func
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Union
-import Products.schemas, Products.crud
-from database import get_db
+from datetime import datetime, timezone
+import Products.schemas, Products.crud, Products.importer, Products.exporter, Products.pricing
+from database import get_db, get_async_db, get_read_db, get_async_read_db
+from cache import etag_matches, make_etag, response_cache
 from datagen import DataGenerator
 import sys
 import os
@@ -11,23 +16,45 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 router = APIRouter(prefix="/products", tags=["Products"])
 generator = DataGenerator()
+category_list_adapter = TypeAdapter(List[Products.schemas.Category])
+
+def json_response(body: bytes, if_none_match: Optional[str] = None, etag: Optional[str] = None) -> Response:
+    """Serve a serialized body with an ETag (content hash unless given), or 304 if the client has it"""
+    etag = etag or make_etag(body)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @router.post("/", response_model=Products.schemas.Product)
 def create_product(product: Products.schemas.ProductCreate, db: Session = Depends(get_db)):
     return Products.crud.create_product_manual(db, product)
 
+@router.post("/import", response_model=Products.schemas.ProductImportReport)
+async def import_products(
+    request: Request,
+    format: Optional[str] = Query(None, regex="^(ndjson|csv)$", description="Body format; defaults from Content-Type"),
+    chunk_size: int = Query(Products.importer.IMPORT_CHUNK_SIZE, ge=1, le=10000, description="Rows per insert batch"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    return await Products.importer.import_products(db, request.stream(), fmt, chunk_size)
+
 @router.get("/", response_model=Products.schemas.ProductListResponse)
-def get_all_products(
-    db: Session = Depends(get_db),
+async def get_all_products(
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db),
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(10, ge=1, le=100, description="Items per page"),
     search: Optional[str] = Query(None, description="Search products"),
-    sort_by: str = Query("created_at", description="Sort by field"),
+    sort_by: str = Query("created_at", description="Sort by created_at, price, name, id, rating or relevance (with search)"),
     sort_dir: str = Query("desc", regex="^(asc|desc)$", description="Sort direction"),
     min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
     max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
     category_id: Optional[int] = Query(None, description="Filter by category"),
-    in_stock_only: bool = Query(False, description="Show only in-stock items")
+    in_stock_only: bool = Query(False, description="Show only in-stock items"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; overrides page"),
+    count: str = Query("exact", regex="^(exact|cached|estimated|none)$", description="How the total is computed"),
+    if_none_match: Optional[str] = Header(None)
 ):
     
     skip = (page - 1) * per_page
@@ -35,45 +62,119 @@ def get_all_products(
         'min_price': min_price,
         'max_price': max_price,
         'category_id': category_id,
-        'in_stock_only': in_stock_only
+        'in_stock_only': in_stock_only,
+        # attr.color=red,blue / attr.material=wood / attr.rating=4 (minimum)
+        **Products.crud.attribute_filters(request.query_params)
+    }
+    cache_params = {
+        **filters, 'page': page, 'per_page': per_page, 'search': search,
+        'sort_by': sort_by, 'sort_dir': sort_dir, 'cursor': cursor, 'count': count
     }
+    cached = response_cache.get("products:list", cache_params)
+    if cached is not None:
+        return json_response(cached, if_none_match)
     
-    total, products = Products.crud.get_paginated_products(
-        db, skip, per_page, search, sort_by, sort_dir, filters
+    result = await Products.crud.get_paginated_products_async(
+        db, skip, per_page, search, sort_by, sort_dir, filters, cursor, count
     )
     
-    clean_products = []
-    for product in products:
-        rating = None
-        if product.attributes and 'rating' in product.attributes:
-            rating = product.attributes['rating']
-        
-        clean_products.append({
-            "id": product.id,
-            "name": product.name,
-            "price": product.price,
-            "brand": product.brand,
-            "stock_quantity": product.inventory.quantity_available if product.inventory else 0,
-            "category_name": product.category.name if product.category else "Unknown",
-            "rating": rating
-        })
+    clean_products = [Products.crud.to_product_summary(product) for product in result.products]
     
-    total_pages = (total + per_page - 1) // per_page
+    total_pages = (result.total + per_page - 1) // per_page if result.total is not None else None
     
-    return {
-        "total": total,
-        "page": page,
-        "per_page": per_page,
-        "total_pages": total_pages,
-        "products": clean_products
+    body = Products.schemas.ProductListResponse(
+        total=result.total,
+        total_exact=result.total_exact,
+        page=page,
+        per_page=per_page,
+        total_pages=total_pages,
+        has_more=result.has_more,
+        products=clean_products,
+        next_cursor=result.next_cursor
+    ).model_dump_json().encode()
+    response_cache.set("products:list", cache_params, body)
+    return json_response(body, if_none_match)
+
+@router.get("/facets", response_model=Products.schemas.ProductFacets)
+async def get_product_facets(
+    request: Request,
+    db: AsyncSession = Depends(get_async_read_db),
+    search: Optional[str] = Query(None, description="Search products"),
+    min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
+    max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
+    category_id: Optional[int] = Query(None, description="Filter by category"),
+    in_stock_only: bool = Query(False, description="Show only in-stock items")
+):
+    filters = {
+        'min_price': min_price,
+        'max_price': max_price,
+        'category_id': category_id,
+        'in_stock_only': in_stock_only,
+        **Products.crud.attribute_filters(request.query_params)
     }
+    return await Products.crud.get_product_facets_async(db, search, filters)
+
+def export_response(query, columns: List[str], fmt: str, name: str) -> StreamingResponse:
+    # Clients pass X-Export-Started-At back as updated_since on their next incremental pull
+    started_at = datetime.now(timezone.utc).isoformat()
+    return StreamingResponse(
+        Products.exporter.stream_export(query, columns, fmt),
+        media_type=Products.exporter.EXPORT_FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{fmt}"',
+            "X-Export-Started-At": started_at
+        }
+    )
+
+@router.get("/export")
+def export_products(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$", description="Output format"),
+    updated_since: Optional[datetime] = Query(None, description="Only products created or changed (incl. inventory) since then")
+):
+    query = Products.exporter.product_export_query(updated_since)
+    return export_response(query, Products.exporter.PRODUCT_EXPORT_COLUMNS, format, "products")
+
+@router.get("/stock-movements/export")
+def export_stock_movements(
+    format: str = Query("ndjson", regex="^(ndjson|csv)$", description="Output format"),
+    updated_since: Optional[datetime] = Query(None, description="Only movements recorded since then"),
+    product_id: Optional[int] = Query(None, description="Only movements for this product")
+):
+    query = Products.exporter.stock_movement_export_query(updated_since, product_id)
+    return export_response(query, Products.exporter.STOCK_MOVEMENT_EXPORT_COLUMNS, format, "stock_movements")
+
+@router.get("/categories", response_model=List[Products.schemas.Category])
+def get_all_categories(db: Session = Depends(get_read_db), if_none_match: Optional[str] = Header(None)):
+    cached = response_cache.get("categories", {})
+    if cached is not None:
+        return json_response(cached, if_none_match)
+    body = category_list_adapter.dump_json(category_list_adapter.validate_python(Products.crud.get_category_tree(db)))
+    response_cache.set("categories", {}, body)
+    return json_response(body, if_none_match)
 
 @router.get("/{product_id}", response_model=Products.schemas.Product)
-def get_product_by_id(product_id: int, db: Session = Depends(get_db)):
-    product = Products.crud.get_product_by_id(db, product_id)
+async def get_product_by_id(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_read_db),
+    if_none_match: Optional[str] = Header(None)
+):
+    etag = await Products.crud.get_product_etag_async(db, product_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Keyed by the ETag, so a cached body can never be staler than the freshness check
+    cache_params = {"etag": etag}
+    cached = response_cache.get(f"product:{product_id}", cache_params)
+    if cached is not None:
+        return json_response(cached, etag=etag)
+    product = await Products.crud.get_product_by_id_async(db, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    body = Products.schemas.Product.model_validate(product).model_dump_json().encode()
+    response_cache.set(f"product:{product_id}", cache_params, body)
+    return json_response(body, etag=etag)
 
 @router.post("/auto-generate", response_model=List[Products.schemas.Product])
 def auto_generate_products(count: int = 1, db: Session = Depends(get_db)):
@@ -82,18 +183,29 @@ def auto_generate_products(count: int = 1, db: Session = Depends(get_db)):
 
 from fastapi import Query
 
-@router.post("/update-prices")
+@router.post("/update-prices", response_model=Products.schemas.PriceUpdateResult)
 def update_all_prices(
-    count: int = Query(50, ge=1, le=500, description="Number of products to update"),
+    rule: Products.schemas.PriceUpdateRule,
+    chunk_size: int = Query(Products.pricing.REPRICE_CHUNK_SIZE, ge=1, le=50000, description="Products per transaction"),
     db: Session = Depends(get_db)
 ):
-    products = Products.crud.get_all_products(db)
-    if not products:
-        return {"message": "No products found to update"}
-    generator.randomly_update_prices(db, products, batch_size=count)
-    return {"message": f"Price updated for {min(count, len(products))} products"}
+    return Products.pricing.reprice_by_rule(db, rule, chunk_size)
+
+@router.post("/update-prices/csv", response_model=Products.schemas.PriceUpdateResult)
+async def update_prices_from_csv(
+    request: Request,
+    reason: str = Query("price list import", max_length=100),
+    chunk_size: int = Query(Products.pricing.REPRICE_CHUNK_SIZE, ge=1, le=50000, description="Products per transaction"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await Products.pricing.reprice_from_csv(db, request.stream(), reason, chunk_size)
 
 
+# Declared before /{product_id} so "bulk" isn't taken as a product id
+@router.patch("/bulk", response_model=Products.schemas.ProductBulkUpdateResult)
+def bulk_update_products(payload: Products.schemas.ProductBulkUpdate, db: Session = Depends(get_db)):
+    return Products.crud.bulk_update_products(db, payload.items)
+
 @router.patch("/{product_id}", response_model=Products.schemas.Product)
 def update_product(
     product_id: str, 
@@ -111,10 +223,8 @@ def update_product(
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    if product_update.category_id is not None:
-        valid_category_ids = [cat.id for cat in Products.crud.get_all_categories(db)]
-        if product_update.category_id not in valid_category_ids:
-            raise HTTPException(status_code=400, detail="Invalid category_id")
+    if product_update.category_id is not None and not Products.crud.category_exists(db, product_update.category_id):
+        raise HTTPException(status_code=400, detail="Invalid category_id")
 
     updated_product = Products.crud.update_product(db, product.id, product_update)
 
@@ -146,8 +256,17 @@ def adjust_inventory(
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/{product_id}/price-history", response_model=Products.schemas.PriceHistoryPage)
+def get_price_history(
+    product_id: int,
+    limit: int = Query(Products.crud.PRICE_HISTORY_PAGE_SIZE, ge=1, le=500, description="Entries per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_read_db)
+):
+    return Products.crud.get_price_history_page(db, product_id, limit, cursor)
+
 @router.get("/{product_id}/stock-movements", response_model=List[Products.schemas.StockMovement])
-def get_stock_movements(product_id: int, db: Session = Depends(get_db)):
+def get_stock_movements(product_id: int, db: Session = Depends(get_read_db)):
     return Products.crud.get_stock_movements_for_product(db, product_id)
 
 @router.patch("/{product_id}/inventory/settings", response_model=Products.schemas.Inventory)
@@ -0,0 +1,64 @@
+from threading import RLock
+from typing import Collection, Dict, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import Products.models
+import random
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class InStockSampler:
+    """Ids of in-stock products in a dense array, for O(1) add/remove and O(k) uniform sampling"""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, product_id: int):
+        with self._lock:
+            if product_id not in self._positions:
+                self._positions[product_id] = len(self._ids)
+                self._ids.append(product_id)
+
+    def remove(self, product_id: int):
+        with self._lock:
+            position = self._positions.pop(product_id, None)
+            if position is None:
+                return
+            # Move the last id into the hole so the array stays dense
+            last = self._ids.pop()
+            if last != product_id:
+                self._ids[position] = last
+                self._positions[last] = position
+
+    def update(self, product_id: int, quantity_available: int):
+        if quantity_available and quantity_available > 0:
+            self.add(product_id)
+        else:
+            self.remove(product_id)
+
+    def reconcile(self, db: Session):
+        """Replace the contents with what the inventory table says is in stock"""
+        ids = list(db.scalars(
+            select(Products.models.Inventory.product_id).where(Products.models.Inventory.quantity_available > 0)
+        ))
+        with self._lock:
+            self._ids = ids
+            self._positions = {product_id: position for position, product_id in enumerate(ids)}
+            self.ready = True
+
+    def sample(self, k: int, exclude: Collection[int] = ()) -> List[int]:
+        with self._lock:
+            wanted = min(k + len(exclude), len(self._ids))
+            picked = random.sample(self._ids, wanted)
+        return [product_id for product_id in picked if product_id not in exclude][:k]
+
+
+in_stock_sampler = InStockSampler()
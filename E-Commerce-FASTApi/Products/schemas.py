@@ -39,6 +39,16 @@ class ProductPriceHistory(ProductPriceHistoryBase):
     class Config:
         from_attributes = True
 
+class PriceHistorySummary(BaseModel):
+    changes: int
+    min_price: float
+    max_price: float
+    last_changed_at: datetime
+
+class PriceHistoryPage(BaseModel):
+    entries: List[ProductPriceHistory]
+    next_cursor: Optional[str] = None
+
 # =========================================================
 # 📦 PRODUCT SCHEMAS
 # =========================================================
@@ -76,6 +86,17 @@ class ProductUpdate(BaseModel):
             raise ValueError('Brand cannot be empty or just whitespace')
         return v.strip() if v else v
 
+class ProductBulkUpdateItem(ProductUpdate):
+    id: int = Field(..., gt=0)
+
+class ProductBulkUpdate(BaseModel):
+    items: List[ProductBulkUpdateItem] = Field(..., min_length=1, max_length=1000)
+
+class ProductBulkUpdateResult(BaseModel):
+    updated: int
+    updated_ids: List[int]
+    not_found: List[int]
+
 # ---------- Output / Full Models ----------
 
 class ProductSummary(BaseModel):
@@ -83,6 +104,7 @@ class ProductSummary(BaseModel):
     name: str
     price: float
     brand: Optional[str] = None
+    stock_quantity: int = 0
     category_name: str
     rating: Optional[float] = None
 
@@ -94,21 +116,105 @@ class Product(ProductBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
     category: Category
+    # Latest changes only; the full history is paged via /products/{id}/price-history
     price_history: List[ProductPriceHistory] = []
+    price_summary: Optional[PriceHistorySummary] = None
 
     class Config:
         from_attributes = True
 
+# =========================================================
+# 📥 BULK IMPORT SCHEMAS
+# =========================================================
+
+class ProductImportRow(ProductCreate):
+    """One imported SKU: the product plus its opening inventory"""
+    quantity_available: int = Field(0, ge=0)
+    reorder_level: int = Field(10, ge=0)
+    reorder_quantity: int = Field(20, gt=0)
+    unit_cost: Optional[float] = Field(None, ge=0)
+    batch_number: Optional[str] = Field(None, max_length=100)
+    location: Optional[str] = Field(None, max_length=100)
+    expiry_date: Optional[datetime] = None
+
+class ProductImportError(BaseModel):
+    line: int
+    error: str
+
+class ProductImportReport(BaseModel):
+    received: int
+    imported: int
+    failed: int
+    errors: List[ProductImportError]
+    errors_truncated: bool = False
+
+# =========================================================
+# 🏷️ REPRICING SCHEMAS
+# =========================================================
+
+class PriceUpdateRule(BaseModel):
+    """Either one percentage for every matching product, or a percentage per category (incl. subcategories)"""
+    percent: Optional[float] = Field(None, gt=-100, le=1000, description="e.g. 10 raises prices by 10%")
+    category_percentages: Optional[Dict[int, float]] = Field(None, description="category_id -> percent")
+    category_id: Optional[int] = Field(None, gt=0, description="Limit a flat percentage to this category tree")
+    brand: Optional[str] = None
+    reason: str = Field("bulk repricing", max_length=100)
+
+    @field_validator('category_percentages')
+    @classmethod
+    def validate_category_percentages(cls, v):
+        if v is not None and any(not -100 < percent <= 1000 for percent in v.values()):
+            raise ValueError('Percentages must be greater than -100 and at most 1000')
+        return v
+
+class PriceUpdateResult(BaseModel):
+    matched: int
+    updated: int
+    unchanged: int
+    not_found: List[int] = []
+    failed: List[str] = []
+
 # =========================================================
 # 📋 PAGINATED RESPONSE SCHEMAS
 # =========================================================
 
 class ProductListResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_exact: bool = True
     page: int
     per_page: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    has_more: bool = False
     products: List[ProductSummary]
+    next_cursor: Optional[str] = None
+
+# =========================================================
+# 🔎 FACET SCHEMAS
+# =========================================================
+
+class CategoryFacet(BaseModel):
+    id: int
+    name: str
+    count: int
+
+class BrandFacet(BaseModel):
+    name: str
+    count: int
+
+class PriceBucketFacet(BaseModel):
+    range: str
+    count: int
+
+class AvailabilityFacet(BaseModel):
+    in_stock: int
+    out_of_stock: int
+
+class ProductFacets(BaseModel):
+    total: int
+    categories: List[CategoryFacet]
+    brands: List[BrandFacet]
+    price_buckets: List[PriceBucketFacet]
+    availability: AvailabilityFacet
 
 # =========================================================
 # 🧮 INVENTORY SCHEMAS
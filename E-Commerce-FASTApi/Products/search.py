@@ -0,0 +1,137 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import RLock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+import Products.models
+import math
+import os
+import re
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+FIELD_WEIGHTS = {"name": 3.0, "brand": 2.0, "attributes": 1.0}
+SEARCHABLE_ATTRIBUTES = ("color", "material")
+# Most ranked ids per IN list when the database sorts or counts matches; larger rankings span several queries
+MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", "1000"))
+MAX_PREFIX_EXPANSIONS = 50
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class ProductSearchIndex:
+    """In-process inverted index over product name, brand and selected attributes"""
+
+    def __init__(self):
+        self._lock = RLock()
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._documents: Dict[int, Dict[str, float]] = {}
+        self._vocabulary: List[str] = []
+        self.ready = False
+
+    @staticmethod
+    def _document_terms(name: str, brand: Optional[str], attributes: Optional[Dict[str, Any]]) -> Dict[str, float]:
+        terms: Dict[str, float] = defaultdict(float)
+        for token in tokenize(name):
+            terms[token] += FIELD_WEIGHTS["name"]
+        for token in tokenize(brand):
+            terms[token] += FIELD_WEIGHTS["brand"]
+        for key in SEARCHABLE_ATTRIBUTES:
+            value = (attributes or {}).get(key)
+            if isinstance(value, str):
+                for token in tokenize(value):
+                    terms[token] += FIELD_WEIGHTS["attributes"]
+        return terms
+
+    def _remove_locked(self, product_id: int):
+        for token in self._documents.pop(product_id, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[token]
+                    index = bisect_left(self._vocabulary, token)
+                    if index < len(self._vocabulary) and self._vocabulary[index] == token:
+                        self._vocabulary.pop(index)
+
+    def upsert(self, product_id: int, name: str, brand: Optional[str], attributes: Optional[Dict[str, Any]]):
+        terms = self._document_terms(name, brand, attributes)
+        with self._lock:
+            self._remove_locked(product_id)
+            for token, weight in terms.items():
+                if token not in self._postings:
+                    insort(self._vocabulary, token)
+                self._postings[token][product_id] = weight
+            self._documents[product_id] = terms
+
+    def index_product(self, product: Products.models.Product):
+        self.upsert(product.id, product.name, product.brand, product.attributes)
+
+    def remove(self, product_id: int):
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def rebuild(self, db: Session, batch_size: int = 5000):
+        fresh = ProductSearchIndex()
+        rows = db.execute(
+            select(
+                Products.models.Product.id,
+                Products.models.Product.name,
+                Products.models.Product.brand,
+                Products.models.Product.attributes
+            ).execution_options(yield_per=batch_size)
+        )
+        for product_id, name, brand, attributes in rows:
+            fresh.upsert(product_id, name, brand, attributes)
+        with self._lock:
+            self._postings = fresh._postings
+            self._documents = fresh._documents
+            self._vocabulary = fresh._vocabulary
+            self.ready = True
+
+    def _matches(self, token: str, prefix: bool) -> Dict[int, float]:
+        if not prefix:
+            return self._postings.get(token, {})
+        matches: Dict[int, float] = {}
+        start = bisect_left(self._vocabulary, token)
+        for candidate in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not candidate.startswith(token):
+                break
+            for product_id, weight in self._postings[candidate].items():
+                matches[product_id] = max(weight, matches.get(product_id, 0.0))
+        return matches
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Ranked (product_id, score) pairs matching every query token; the last token matches as a prefix"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            total_documents = max(len(self._documents), 1)
+            scores: Optional[Dict[int, float]] = None
+            for position, token in enumerate(tokens):
+                matches = self._matches(token, prefix=position == len(tokens) - 1)
+                if not matches:
+                    return []
+                idf = math.log(1 + total_documents / len(matches))
+                if scores is None:
+                    scores = {product_id: weight * idf for product_id, weight in matches.items()}
+                else:
+                    scores = {
+                        product_id: score + matches[product_id] * idf
+                        for product_id, score in scores.items() if product_id in matches
+                    }
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked if limit is None else ranked[:limit]
+
+    def index_products(self, products: Iterable[Products.models.Product]):
+        for product in products:
+            self.index_product(product)
+
+
+product_search_index = ProductSearchIndex()
@@ -1,11 +1,12 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from .models import User
 from .schemas import UserCreate
-from auth import get_password_hash
+from auth import get_password_hash, get_password_hash_async, invalidate_principal
 
-def create_user(db: Session, user: UserCreate):
-    hashed_pw = get_password_hash(user.password)
-    db_user = User(
+def _build_user(user: UserCreate, hashed_pw: str) -> User:
+    return User(
         username=user.username,
         email=user.email,
         password=hashed_pw,
@@ -15,14 +16,27 @@ def create_user(db: Session, user: UserCreate):
         nationality=user.nationality,
         is_active=user.is_active
     )
+
+def create_user(db: Session, user: UserCreate):
+    db_user = _build_user(user, get_password_hash(user.password))
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+async def create_user_async(db: AsyncSession, user: UserCreate):
+    db_user = _build_user(user, await get_password_hash_async(user.password))
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email))
+
 def get_user_by_id(db: Session, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
 
@@ -34,5 +48,15 @@ def delete_user(db: Session, user_id: int):
     if user:
         db.delete(user)
         db.commit()
+        invalidate_principal(user_id)
+        return True
+    return False
+
+def deactivate_user(db: Session, user_id: int):
+    user = get_user_by_id(db, user_id)
+    if user:
+        user.is_active = False
+        db.commit()
+        invalidate_principal(user_id)
         return True
     return False
\ No newline at end of file
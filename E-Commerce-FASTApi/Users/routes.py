@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from database import get_db
+from database import get_db, get_read_db, get_async_db, get_async_read_db
 from . import schemas, crud
-from auth import create_access_token, verify_password
+from auth import create_access_token, verify_and_update_password_async
 from utils import get_current_user
 from typing import Any, Dict, List, Optional
 from Products.crud import get_all_products
@@ -18,17 +19,25 @@ from Products import crud as product_crud
 router = APIRouter(tags=['Users'])
 
 @router.post("/register", response_model=schemas.UserOut)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = crud.get_user_by_email(db, user.email)
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = await crud.get_user_by_email_async(db, user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db, user)
+    return await crud.create_user_async(db, user)
 
 @router.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await crud.get_user_by_email_async(db, form_data.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    # Release the connection while bcrypt runs
+    await db.commit()
+    verified, new_hash = await verify_and_update_password_async(form_data.password, user.password)
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
     token = create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
 
@@ -50,6 +59,15 @@ def remove_user(user_id: int, db: Session = Depends(get_db), current_user=Depend
         raise HTTPException(status_code=404, detail="User not found")
     return {"detail": f"User {user_id} deleted"}
 
+@router.post("/{user_id}/deactivate")
+def deactivate_user(user_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    success = crud.deactivate_user(db, user_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"detail": f"User {user_id} deactivated"}
+
 @router.get("/{user_id}/orders", response_model=List[OrderResponse])
 def get_user_orders(user_id: int, current_user=Depends(get_current_user)):
     if current_user.id != user_id:
@@ -79,13 +97,13 @@ def get_user_cart_route(user_id: int, current_user=Depends(get_current_user)):
     return get_user_cart(user_id)
 
 @router.get("/{user_id}/products_recommendations")
-def get_recommendations(user_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
+def get_recommendations(user_id: int, db: Session = Depends(get_read_db), current_user=Depends(get_current_user)):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
     return product_crud.generate_recommendations(user_id=user_id, limit=5, db=db)
 
 @router.get("/{user_id}/browse_products", response_model=Dict[str, Any])
-def browse_products(
+async def browse_products(
     user_id: int,
     page: int = Query(1, ge=1),
     per_page: int = Query(10, ge=1, le=100),
@@ -96,7 +114,9 @@ def browse_products(
     max_price: Optional[float] = Query(None, ge=0),
     category_id: Optional[int] = Query(None),
     in_stock_only: bool = Query(False),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", regex="^(exact|cached|estimated|none)$"),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user = Depends(get_current_user)
 ):
     if current_user.id != user_id:
@@ -110,60 +130,66 @@ def browse_products(
         "in_stock_only": in_stock_only
     }
 
-    total, products = product_crud.get_paginated_products(
+    result = await product_crud.get_paginated_products_async(
         db=db,
         skip=skip,
         limit=per_page,
         search=search,
         sort_by=sort_by,
         sort_dir=sort_dir,
-        filters=filters
+        filters=filters,
+        cursor=cursor,
+        count=count
     )
 
-    total_pages = (total + per_page - 1) // per_page
+    total_pages = (result.total + per_page - 1) // per_page if result.total is not None else None
 
     return {
-        "total": total,
+        "total": result.total,
+        "total_exact": result.total_exact,
         "page": page,
         "per_page": per_page,
         "total_pages": total_pages,
-        "products": products
+        "has_more": result.has_more,
+        "products": [product_crud.to_product_summary(product) for product in result.products],
+        "next_cursor": result.next_cursor
     }
 @router.post("/{user_id}/addToCart", response_model=CartItemResponse)
-def add_to_cart(
+async def add_to_cart(
     user_id: int,
     item: CartItemCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     # Get or create a cart for the user
-    cart = db.query(order_crud.Cart).filter_by(user_id=user_id).first()
-    if not cart:
-        cart = order_crud.create_cart(db, CartCreate(user_id=user_id))
+    cart_id = await order_crud.get_user_cart_id_async(db, user_id)
+    if not cart_id:
+        cart = await db.run_sync(order_crud.create_cart, CartCreate(user_id=user_id))
+        cart_id = cart.cart_id
 
-    return order_crud.add_item(db=db, cart_id=cart.cart_id, item_in=item)
+    return await order_crud.add_item_async(db=db, cart_id=cart_id, item_in=item)
 @router.get("/{user_id}/mycart", response_model=List[CartItemResponse])
-def my_cart(
+async def my_cart(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    cart = db.query(order_crud.Cart).filter_by(user_id=user_id).first()
-    if not cart:
+    cart_id = await order_crud.get_user_cart_id_async(db, user_id)
+    if not cart_id:
         return []
-    return order_crud.list_cart_items(db, cart.cart_id)
+    return await order_crud.list_cart_items_async(db, cart_id)
 
 
 @router.get("/{user_id}/myorders", response_model=List[OrderResponse])
 def my_orders(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
     if current_user.id != user_id:
@@ -209,14 +235,14 @@ def clear_cart(
     return {"message": "Cart cleared"}
 
 @router.post("/{user_id}/checkout", response_model=OrderResponse)
-def checkout(
+async def checkout(
     user_id: int,
     order_in: OrderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user=Depends(get_current_user)
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
-    return order_crud.create_order(db, order_in)
+    return await order_crud.create_order_async(db, order_in)
 
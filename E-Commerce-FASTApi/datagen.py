@@ -9,7 +9,12 @@ from Products.models import Product, Category, Inventory
 import sys
 import os
 from Orders.models import Cart, CartItem, Order, OrderStatus
-from Products.crud import reserve_products, finalize_products
+from Orders.crud import RESERVATION_SOLD
+from Products.crud import (
+    reserve_stock, finalize_products, invalidate_listing_caches, rebuild_category_tree, sample_in_stock_products
+)
+from Products.sampler import in_stock_sampler
+from Products.search import product_search_index
 from datetime import datetime, timezone, timedelta
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -91,6 +96,7 @@ class DataGenerator:
                     db.flush()
                     categories.append(sub_cat)
             db.commit()
+            rebuild_category_tree(db)
         except Exception as e:
             db.rollback()
         return categories
@@ -125,6 +131,7 @@ class DataGenerator:
 
     def create_products(self, db: Session, categories: List[Category], count: int) -> List[Product]:
         products = []
+        stocked = []
         
         categories_with_expiry = {
             "Food & Beverage", "Health & Beauty"
@@ -178,24 +185,33 @@ class DataGenerator:
                 db.add(inventory)
 
                 products.append(product)
+                stocked.append((product.id, stock_quantity))
 
             db.commit()
+            invalidate_listing_caches()
+            for product_id, quantity in stocked:
+                in_stock_sampler.update(product_id, quantity)
+            product_search_index.index_products(products)
         except Exception as e:
             db.rollback()
         return products
     
 
 
-    def create_carts_and_orders(self, db: Session, users: list[User], products: list[Product], num_orders: int = 100):
+    def create_carts_and_orders(self, db: Session, users: list[User], num_orders: int = 100):
         created_orders = 0
 
         for _ in range(num_orders):
             user = random.choice(users)
+            product_ids = sample_in_stock_products(db, random.randint(1, 5))
+            if not product_ids:
+                break
+
             cart = Cart(user_id=user.id, created_at=utc_now())
             db.add(cart)
             db.flush()  # generate cart_id
 
-            selected_products = random.sample(products, k=min(random.randint(1, 5), len(products)))
+            selected_products = db.query(Product).filter(Product.id.in_(product_ids)).all()
             order_items = []
             total_amount = 0.0
             failed = False
@@ -204,15 +220,18 @@ class DataGenerator:
                 quantity = random.randint(1, 3)
 
                 # Reserve stock
-                if not reserve_products(db, product_id=product.id, quantity=quantity):
+                if not reserve_stock(db, product_id=product.id, quantity=quantity):
                     failed = True
                     break
 
-                # Add to cart
+                # Add to cart; the order below buys it, so it's kept as sold rather than reserved
                 cart_item = CartItem(
                     cart_id=cart.cart_id,
+                    user_id=user.id,
                     product_id=product.id,
-                    quantity=quantity
+                    quantity=quantity,
+                    price=float(product.price),
+                    reserved_until=RESERVATION_SOLD
                 )
                 db.add(cart_item)
 
@@ -240,9 +259,14 @@ class DataGenerator:
                 shipping_address=fake.address()
             )
             db.add(order)
+            db.flush()
 
             # Finalize inventory, simulate confirmation
-            finalize_products(db, order)
+            finalize_products(
+                reservations=[{"product_id": item["product_id"], "quantity": item["qty"]} for item in order_items],
+                order_id=str(order.order_id),
+                db=db
+            )
 
             created_orders += 1
 
@@ -3,18 +3,21 @@ from fastapi import FastAPI
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
+from datetime import datetime
 
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Database and Base import
-from database import SessionLocal, engine, Base
+from auth import shutdown_hash_pool
+from database import SessionLocal, engine, async_engine, async_read_engine, Base
 
 # Routers
 from Products.routes import router as products_router
 from Orders.routes import order_router
 from Users.routes import router as users_router
 from Orders.routes import cart_router
+from metrics import router as metrics_router
 
 # Logger and Data Generator
 from datagen import DataGenerator
@@ -22,12 +25,23 @@ from datagen import DataGenerator
 # Models
 from Users.models import User
 from Products.models import Product, Category
+from Products.categories import category_tree
+from Products.hot_stock import HOT_STOCK_FLUSH_SECONDS, HOT_STOCK_PRODUCT_IDS, hot_stock
+from Products.crud import rebuild_category_tree, refresh_search_index, sync_promoted_attributes
+from Products.recommendations import rebuild_neighbor_table
+from Orders.crud import release_expired_reservations
+from Products.sampler import in_stock_sampler
 
 # Load environment variables and create DB tables
 load_dotenv()
 Base.metadata.create_all(bind=engine)
 generator = DataGenerator()
 scheduler = BackgroundScheduler()
+SEARCH_INDEX_REFRESH_MINUTES = int(os.getenv("SEARCH_INDEX_REFRESH_MINUTES", "10"))
+CATEGORY_TREE_REFRESH_MINUTES = int(os.getenv("CATEGORY_TREE_REFRESH_MINUTES", "10"))
+RECOMMENDATION_REFRESH_MINUTES = int(os.getenv("RECOMMENDATION_REFRESH_MINUTES", "60"))
+STOCK_SAMPLER_RECONCILE_MINUTES = int(os.getenv("STOCK_SAMPLER_RECONCILE_MINUTES", "5"))
+CART_SWEEP_INTERVAL_MINUTES = int(os.getenv("CART_SWEEP_INTERVAL_MINUTES", "1"))
 
 # APScheduler Task
 def scheduled_data_generation():
@@ -42,21 +56,110 @@ def scheduled_data_generation():
         generator.create_products(db, categories=categories, count=10)
 
         users = db.query(User).all()
-        products = db.query(Product).all()
+        if users:
+            generator.create_carts_and_orders(db, users, num_orders=10)
+    finally:
+        db.close()
+
+# Rebuilds the search index from the DB, picking up writes made by other workers
+def scheduled_search_index_refresh():
+    db: Session = SessionLocal()
+    try:
+        refresh_search_index(db)
+    finally:
+        db.close()
 
-        if users and products:
-            generator.create_carts_and_orders(db, users, products, num_orders=10)
+# Rebuilds the closure table on startup so category filters see the current tree
+def startup_category_tree_rebuild():
+    db: Session = SessionLocal()
+    try:
+        rebuild_category_tree(db)
     finally:
         db.close()
+
+# Fills promoted attribute columns for products written before they existed
+def startup_promoted_attribute_sync():
+    db: Session = SessionLocal()
+    try:
+        sync_promoted_attributes(db)
+    finally:
+        db.close()
+
+# Reloads the category tree and repairs the closure table after categories written outside the app
+def scheduled_category_tree_refresh():
+    db: Session = SessionLocal()
+    try:
+        rebuild_category_tree(db, only_if_changed=True)
+    finally:
+        db.close()
+
+# Recomputes the co-purchase neighbor table from order history
+def scheduled_recommendation_refresh():
+    db: Session = SessionLocal()
+    try:
+        rebuild_neighbor_table(db)
+    finally:
+        db.close()
+
+# Resyncs the in-stock sampler with inventory changed by other workers
+def scheduled_stock_sampler_reconcile():
+    db: Session = SessionLocal()
+    try:
+        in_stock_sampler.reconcile(db)
+    finally:
+        db.close()
+
+# Gives back stock held by abandoned carts whose reservations expired
+def scheduled_reservation_sweep():
+    db: Session = SessionLocal()
+    try:
+        result = release_expired_reservations(db)
+        if result["items_released"]:
+            print(f"🧹 Released {result['units_released']} unit(s) from {result['items_released']} expired cart item(s) in {result['seconds']}s")
+    finally:
+        db.close()
+
+# Replays the write-behind journal and takes the hot products' counters into memory
+def startup_hot_stock_load():
+    db: Session = SessionLocal()
+    try:
+        replayed = hot_stock.load(db, HOT_STOCK_PRODUCT_IDS)
+        print(f"🔥 Hot stock: {len(HOT_STOCK_PRODUCT_IDS)} product(s), {replayed} journal entries replayed")
+    finally:
+        db.close()
+
+# Writes hot product reservations made since the last flush to the inventory table
+def scheduled_hot_stock_flush():
+    db: Session = SessionLocal()
+    try:
+        hot_stock.flush(db)
+    finally:
+        db.close()
+
 # Lifespan Context Manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Starting up...")
+    startup_category_tree_rebuild()
+    if HOT_STOCK_PRODUCT_IDS:
+        startup_hot_stock_load()
+        scheduler.add_job(scheduled_hot_stock_flush, "interval", seconds=HOT_STOCK_FLUSH_SECONDS, max_instances=1, coalesce=True)
     scheduler.add_job(scheduled_data_generation, "interval", minutes=10)
+    scheduler.add_job(scheduled_search_index_refresh, "interval", minutes=SEARCH_INDEX_REFRESH_MINUTES, next_run_time=datetime.now())
+    scheduler.add_job(scheduled_category_tree_refresh, "interval", minutes=CATEGORY_TREE_REFRESH_MINUTES)
+    scheduler.add_job(startup_promoted_attribute_sync, next_run_time=datetime.now())
+    scheduler.add_job(scheduled_stock_sampler_reconcile, "interval", minutes=STOCK_SAMPLER_RECONCILE_MINUTES, next_run_time=datetime.now())
+    scheduler.add_job(scheduled_reservation_sweep, "interval", minutes=CART_SWEEP_INTERVAL_MINUTES, max_instances=1, coalesce=True)
+    scheduler.add_job(scheduled_recommendation_refresh, "interval", minutes=RECOMMENDATION_REFRESH_MINUTES, next_run_time=datetime.now())
     scheduler.start()
     yield
     print("🛑 Shutting down...")
     scheduler.shutdown(wait=False)
+    if hot_stock.ready:
+        scheduled_hot_stock_flush()
+    shutdown_hash_pool()
+    await async_engine.dispose()
+    await async_read_engine.dispose()
 
 # FastAPI App
 app = FastAPI(description="FastAPI E-commerce Project", lifespan=lifespan)
@@ -65,4 +168,5 @@ app = FastAPI(description="FastAPI E-commerce Project", lifespan=lifespan)
 app.include_router(users_router, prefix="/users")
 app.include_router(products_router)
 app.include_router(order_router)
-app.include_router(cart_router)
\ No newline at end of file
+app.include_router(cart_router)
+app.include_router(metrics_router)
\ No newline at end of file
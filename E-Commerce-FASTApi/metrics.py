@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from auth import principal_cache, hash_pool_status
+from cache import response_cache
+from Orders.crud import reservation_sweep_stats
+from database import engine, async_engine, read_engine, async_read_engine, DATABASE_READ_URL, pool_status
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+@router.get("/pool")
+def get_pool_metrics():
+    pools = {
+        "primary": pool_status(engine),
+        "primary_async": pool_status(async_engine)
+    }
+    if DATABASE_READ_URL:
+        pools["replica"] = pool_status(read_engine)
+        pools["replica_async"] = pool_status(async_read_engine)
+    return pools
+
+@router.get("/auth-cache")
+def get_auth_cache_metrics():
+    return principal_cache.stats()
+
+@router.get("/hash-pool")
+def get_hash_pool_metrics():
+    return hash_pool_status()
+
+@router.get("/cache")
+def get_response_cache_metrics():
+    return response_cache.stats()
+
+@router.get("/reservation-sweeper")
+def get_reservation_sweeper_metrics():
+    return reservation_sweep_stats
\ No newline at end of file
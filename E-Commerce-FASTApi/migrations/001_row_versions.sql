@@ -0,0 +1,4 @@
+-- Row version counters used by the product detail ETag.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+ALTER TABLE products ADD COLUMN version INT NOT NULL DEFAULT 1;
+ALTER TABLE categories ADD COLUMN version INT NOT NULL DEFAULT 1;
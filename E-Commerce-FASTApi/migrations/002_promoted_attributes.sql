@@ -0,0 +1,15 @@
+-- Indexed copies of the color, material and rating attributes, used by attr.* filters, facets and rating sorts.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+ALTER TABLE products ADD COLUMN attr_color VARCHAR(50) NULL;
+ALTER TABLE products ADD COLUMN attr_material VARCHAR(50) NULL;
+ALTER TABLE products ADD COLUMN attr_rating FLOAT NULL;
+CREATE INDEX ix_products_attr_color ON products (attr_color);
+CREATE INDEX ix_products_attr_material ON products (attr_material);
+CREATE INDEX ix_products_attr_rating ON products (attr_rating);
+-- Backfill from the JSON the way Products.models.promoted_values does (MySQL 8.0.21+ for JSON_VALUE).
+-- On large tables this can be skipped: the startup sync_promoted_attributes job fills them in batches.
+UPDATE products SET
+    attr_color = NULLIF(LOWER(LEFT(TRIM(JSON_VALUE(attributes, '$.color')), 50)), ''),
+    attr_material = NULLIF(LOWER(LEFT(TRIM(JSON_VALUE(attributes, '$.material')), 50)), ''),
+    attr_rating = JSON_VALUE(attributes, '$.rating' RETURNING DOUBLE NULL ON ERROR)
+WHERE attributes IS NOT NULL;
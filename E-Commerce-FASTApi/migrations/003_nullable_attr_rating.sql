@@ -0,0 +1,4 @@
+-- attr_rating is NULL for products without a rating; it used to default to 0, which hid genuine zero ratings.
+-- Only for databases whose products table got attr_rating from create_all before this change
+-- (002 already adds it as nullable); create_all doesn't alter existing columns.
+ALTER TABLE products MODIFY COLUMN attr_rating FLOAT NULL DEFAULT NULL;
@@ -0,0 +1,18 @@
+-- Reservation expiry for cart items, read by the reservation sweeper through its index.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+ALTER TABLE cart_items ADD COLUMN reserved_until DATETIME NULL;
+CREATE INDEX ix_cart_items_reserved_until ON cart_items (reserved_until);
+-- Items the user has since ordered were finalized, so their stock is sold: mark them like
+-- Orders.crud.RESERVATION_SOLD so the sweeper never hands it back.
+UPDATE cart_items
+SET reserved_until = '9999-12-31 00:00:00'
+WHERE reserved_until IS NULL
+  AND EXISTS (
+    SELECT 1 FROM orders
+    WHERE orders.user_id = cart_items.user_id
+      AND JSON_CONTAINS(orders.items, JSON_OBJECT('product_id', cart_items.product_id))
+  );
+-- The rest still hold reserved stock; give them one reservation TTL (CART_RESERVATION_TTL_MINUTES) from now.
+UPDATE cart_items
+SET reserved_until = UTC_TIMESTAMP() + INTERVAL 30 MINUTE
+WHERE reserved_until IS NULL;
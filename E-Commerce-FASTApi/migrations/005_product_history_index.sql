@@ -0,0 +1,3 @@
+-- Composite index behind the embedded price history summary and the paged full history (newest first per product).
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+CREATE INDEX ix_product_history_product_changed ON product_history (product_id, changed_at);
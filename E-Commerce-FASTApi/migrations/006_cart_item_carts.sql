@@ -0,0 +1,14 @@
+-- Cart items belong to a cart (cart_items.cart_id), which the cart routes and the Cart.items relationship read.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+ALTER TABLE cart_items ADD COLUMN cart_id INT NULL;
+-- Existing items were only keyed by user: give users without a cart one, then attach their items to
+-- their first cart, the one Orders.crud picks for the user.
+INSERT INTO carts (user_id, created_at)
+SELECT DISTINCT cart_items.user_id, UTC_TIMESTAMP()
+FROM cart_items
+WHERE NOT EXISTS (SELECT 1 FROM carts WHERE carts.user_id = cart_items.user_id);
+UPDATE cart_items
+SET cart_id = (SELECT MIN(carts.cart_id) FROM carts WHERE carts.user_id = cart_items.user_id);
+ALTER TABLE cart_items MODIFY COLUMN cart_id INT NOT NULL;
+CREATE INDEX ix_cart_items_cart_id ON cart_items (cart_id);
+ALTER TABLE cart_items ADD CONSTRAINT cart_items_ibfk_cart FOREIGN KEY (cart_id) REFERENCES carts (cart_id);
@@ -0,0 +1,3 @@
+-- The order a stock movement was made for (checkout finalization or an adjustment for an order); NULL otherwise.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+ALTER TABLE stock_movements ADD COLUMN order_id INT NULL;
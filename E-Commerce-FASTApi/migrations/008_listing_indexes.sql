@@ -0,0 +1,10 @@
+-- Secondary indexes the models declare for listing sorts, category filters and incremental exports,
+-- and root categories (parent_id NULL) for the category tree.
+-- Base.metadata.create_all only creates missing tables, so existing databases need this once.
+CREATE INDEX ix_products_category_id ON products (category_id);
+CREATE INDEX ix_products_created_at ON products (created_at);
+CREATE INDEX ix_products_updated_at ON products (updated_at);
+ALTER TABLE categories MODIFY COLUMN parent_id INT NULL;
+CREATE INDEX ix_categories_parent_id ON categories (parent_id);
+CREATE INDEX ix_inventory_last_updated ON inventory (last_updated);
+CREATE INDEX ix_stock_movements_timestamp ON stock_movements (timestamp);
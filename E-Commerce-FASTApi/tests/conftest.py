@@ -0,0 +1,66 @@
+"""Shared fixtures: the app runs against a throwaway SQLite database seeded with a small catalog"""
+import os
+import sys
+import tempfile
+
+# Settings are read at import time, so they have to be in place before the app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ecommerce-tests-'), 'test.db')}"
+os.environ["RESPONSE_CACHE_BACKEND"] = "memory"
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+import database
+import main
+from datagen import DataGenerator
+from Products.crud import refresh_search_index
+
+CATALOG_SIZE = 60
+
+
+@pytest.fixture(scope="session")
+def client():
+    # No lifespan: the scheduler and its startup jobs stay off, fixtures load what the tests need
+    return TestClient(main.app)
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture(scope="session")
+def catalog(client):
+    """Categories and CATALOG_SIZE products with inventory; the ids of the products"""
+    session = database.SessionLocal()
+    try:
+        generator = DataGenerator()
+        products = generator.create_products(session, generator.create_categories(session), CATALOG_SIZE)
+        refresh_search_index(session)
+        product_ids = [product.id for product in products]
+    finally:
+        session.close()
+    # Opens the async engine's first connection so later statement counts only see the request's queries
+    client.get("/products/", params={"per_page": 1})
+    return product_ids
+
+@pytest.fixture
+def statements():
+    """Every SQL statement sent through the sync and async engines while the test runs"""
+    executed = []
+    engines = {database.engine, database.read_engine, database.async_engine.sync_engine, database.async_read_engine.sync_engine}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", record)
@@ -0,0 +1,96 @@
+"""The reservation sweeper hands back only stock that is still reserved"""
+from datetime import timedelta
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select
+import Orders.crud
+from datagen import DataGenerator
+from Orders.models import Cart, CartItem, Order, utc_now
+from Orders.schemas import CartCreate, CartItemCreate, OrderCreate, OrderItem
+from Products.models import Category, Inventory, Product, StockMovement
+
+USER_ID = 9001
+
+
+@pytest.fixture
+def product_id(db):
+    """A product with 10 units available; its id"""
+    product = Product(name="Cart Product", price=10, brand="Acme", category_id=db.scalar(select(Category.id).limit(1)))
+    db.add(product)
+    db.flush()
+    db.add(Inventory(product_id=product.id, quantity_available=10, quantity_reserve=0))
+    db.commit()
+    yield product.id
+    db.query(CartItem).filter(CartItem.product_id == product.id).delete()
+    db.query(StockMovement).filter(StockMovement.product_id == product.id).delete()
+    db.query(Inventory).filter(Inventory.product_id == product.id).delete()
+    db.query(Product).filter(Product.id == product.id).delete()
+    db.commit()
+
+def stock(db, product_id):
+    db.expire_all()
+    inventory = db.scalars(select(Inventory).where(Inventory.product_id == product_id)).one()
+    return inventory.quantity_available, inventory.quantity_reserve
+
+def expire_all_reservations(db):
+    db.query(CartItem).filter(CartItem.reserved_until < Orders.crud.RESERVATION_SOLD).update(
+        {CartItem.reserved_until: utc_now().replace(tzinfo=None) - timedelta(minutes=1)}, synchronize_session=False
+    )
+    db.commit()
+
+def checkout(db, product_id, quantity):
+    Orders.crud.create_order(db, OrderCreate(
+        user_id=USER_ID, items=[OrderItem(product_id=product_id, quantity=quantity, price=10)],
+        shipping_address="1 Test Street", payment_method="card"
+    ))
+
+
+def test_checkout_takes_bought_units_out_of_the_cart(catalog, db, product_id):
+    cart = Orders.crud.create_cart(db, CartCreate(user_id=USER_ID))
+    Orders.crud.add_item(db, cart.cart_id, CartItemCreate(product_id=product_id, quantity=3))
+    checkout(db, product_id, 2)
+    assert stock(db, product_id) == (7, 1)
+    assert [item.quantity for item in db.query(CartItem).filter_by(product_id=product_id)] == [1]
+
+    expire_all_reservations(db)
+    result = Orders.crud.release_expired_reservations(db)
+    assert (result["items_released"], result["units_released"]) == (1, 1)
+    assert stock(db, product_id) == (8, 0)
+
+def test_sold_items_are_never_merged_or_swept(catalog, db, product_id):
+    cart = Orders.crud.create_cart(db, CartCreate(user_id=USER_ID))
+    db.add(CartItem(
+        cart_id=cart.cart_id, user_id=USER_ID, product_id=product_id, quantity=5, price=10,
+        reserved_until=Orders.crud.RESERVATION_SOLD
+    ))
+    db.commit()
+    Orders.crud.add_item(db, cart.cart_id, CartItemCreate(product_id=product_id, quantity=2))
+    assert sorted(item.quantity for item in db.query(CartItem).filter_by(product_id=product_id)) == [2, 5]
+
+    expire_all_reservations(db)
+    result = Orders.crud.release_expired_reservations(db)
+    assert result["units_released"] == 2
+    assert stock(db, product_id) == (10, 0)
+    assert [item.quantity for item in db.query(CartItem).filter_by(product_id=product_id)] == [5]
+
+def test_units_skipped_by_the_release_are_not_counted(catalog, db, product_id):
+    cart = Orders.crud.create_cart(db, CartCreate(user_id=USER_ID))
+    # Nothing was reserved for it, so the release finds no reserve to give back
+    db.add(CartItem(
+        cart_id=cart.cart_id, user_id=USER_ID, product_id=product_id, quantity=4, price=10,
+        reserved_until=utc_now().replace(tzinfo=None) - timedelta(minutes=1)
+    ))
+    db.commit()
+    result = Orders.crud.release_expired_reservations(db)
+    assert (result["items_released"], result["units_released"]) == (1, 0)
+    assert stock(db, product_id) == (10, 0)
+
+def test_generated_orders_keep_their_stock_after_the_carts_age(catalog, db):
+    DataGenerator().create_carts_and_orders(db, [SimpleNamespace(id=USER_ID)], num_orders=5)
+    before = db.execute(select(Inventory.product_id, Inventory.quantity_available, Inventory.quantity_reserve)).all()
+    db.query(Cart).update({Cart.created_at: utc_now() - timedelta(days=2)}, synchronize_session=False)
+    db.commit()
+
+    assert Orders.crud.release_expired_reservations(db)["units_released"] == 0
+    assert db.execute(select(Inventory.product_id, Inventory.quantity_available, Inventory.quantity_reserve)).all() == before
+    assert db.query(Order).filter_by(user_id=USER_ID).count() > 0
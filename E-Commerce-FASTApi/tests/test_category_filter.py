@@ -0,0 +1,34 @@
+from Products.crud import invalidate_listing_caches, rebuild_category_tree
+from Products.models import Category, CategoryClosure, Inventory, Product
+
+
+def test_category_added_since_the_last_rebuild_is_filterable(client, catalog, db):
+    parent = db.query(Category).filter(Category.parent_id.is_(None)).first()
+    category = Category(name="Added At Runtime", parent_id=parent.id)
+    db.add(category)
+    db.flush()
+    product = Product(name="Runtime Category Product", price=10, brand="Acme", category_id=category.id)
+    db.add(product)
+    db.flush()
+    inventory = Inventory(product_id=product.id, quantity_available=5)
+    db.add(inventory)
+    db.commit()
+    try:
+        response = client.get("/products/", params={"category_id": category.id})
+        assert response.status_code == 200
+        assert [item["id"] for item in response.json()["products"]] == [product.id]
+
+        # The periodic refresh repairs the closure so the parent's subtree includes it too
+        assert rebuild_category_tree(db, only_if_changed=True)
+        assert db.get(CategoryClosure, (parent.id, category.id)).depth == 1
+        assert not rebuild_category_tree(db, only_if_changed=True)
+        response = client.get("/products/", params={"category_id": parent.id, "per_page": 100})
+        assert product.id in [item["id"] for item in response.json()["products"]]
+    finally:
+        db.delete(inventory)
+        db.delete(product)
+        db.flush()
+        db.delete(category)
+        db.commit()
+        rebuild_category_tree(db)
+        invalidate_listing_caches()
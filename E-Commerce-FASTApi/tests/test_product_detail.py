@@ -0,0 +1,40 @@
+from Products.crud import invalidate_listing_caches, rebuild_category_tree
+from Products.models import Category, Product
+
+CHAIN_DEPTH = 8
+
+
+def test_detail_embeds_a_deep_category_tree_and_follows_changes(client, catalog, db):
+    chain = []
+    for level in range(CHAIN_DEPTH):
+        category = Category(name=f"Level {level}", parent_id=chain[-1].id if chain else None)
+        db.add(category)
+        db.flush()
+        chain.append(category)
+    product = Product(name="Deep Product", price=10, brand="Acme", category_id=chain[0].id)
+    db.add(product)
+    db.commit()
+    rebuild_category_tree(db)
+    try:
+        response = client.get(f"/products/{product.id}")
+        assert response.status_code == 200
+        node, depth = response.json()["category"], 1
+        while node["children"]:
+            node, depth = node["children"][0], depth + 1
+        assert (depth, node["name"]) == (CHAIN_DEPTH, f"Level {CHAIN_DEPTH - 1}")
+
+        # Renamed elsewhere (another worker): this worker's tree is reloaded for the detail
+        chain[-1].name = "Renamed Leaf"
+        db.commit()
+        node = client.get(f"/products/{product.id}").json()["category"]
+        while node["children"]:
+            node = node["children"][0]
+        assert node["name"] == "Renamed Leaf"
+    finally:
+        db.delete(product)
+        for category in reversed(chain):
+            db.delete(category)
+            db.flush()
+        db.commit()
+        rebuild_category_tree(db)
+        invalidate_listing_caches()
@@ -0,0 +1,36 @@
+from Products.models import Category, Product
+
+
+def etag_of(client, product_id):
+    response = client.get(f"/products/{product_id}")
+    assert response.status_code == 200
+    return response.headers["ETag"]
+
+def test_writes_within_one_second_change_the_etag(client, catalog):
+    product_id = catalog[0]
+    assert client.patch(f"/products/{product_id}", json={"name": "First Name"}).status_code == 200
+    first = etag_of(client, product_id)
+    assert client.patch(f"/products/{product_id}", json={"name": "Second Name"}).status_code == 200
+
+    response = client.get(f"/products/{product_id}", headers={"If-None-Match": first})
+    assert response.status_code == 200
+    assert response.json()["name"] == "Second Name"
+    assert response.headers["ETag"] != first
+
+def test_renaming_a_child_category_changes_the_parent_products_etag(client, catalog, db):
+    # The generated catalog is random, so pick a parent that has products of its own
+    product = db.query(Product).filter(
+        Product.category_id.in_(db.query(Category.parent_id).filter(Category.parent_id.isnot(None)))
+    ).first()
+    child = db.query(Category).filter(Category.parent_id == product.category_id).first()
+    before = etag_of(client, product.id)
+
+    child.name = f"{child.name} Renamed"
+    db.commit()
+
+    assert client.get(f"/products/{product.id}", headers={"If-None-Match": before}).status_code == 200
+    assert etag_of(client, product.id) != before
+
+def test_unchanged_product_still_revalidates(client, catalog):
+    etag = etag_of(client, catalog[1])
+    assert client.get(f"/products/{catalog[1]}", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,44 @@
+import json
+import pytest
+from Products.crud import invalidate_listing_caches
+from Products.models import Inventory, Product
+
+
+@pytest.fixture
+def imported(db):
+    """Names of products the test imports; they're removed again afterwards"""
+    names = []
+    yield names
+    product_ids = [product_id for (product_id,) in db.query(Product.id).filter(Product.name.in_(names))]
+    db.query(Inventory).filter(Inventory.product_id.in_(product_ids)).delete()
+    db.query(Product).filter(Product.id.in_(product_ids)).delete()
+    db.commit()
+    invalidate_listing_caches()
+
+def test_invalid_utf8_fails_only_its_row(client, catalog, imported):
+    imported += ["Import First", "Import Last"]
+    body = b"\n".join([
+        json.dumps({"name": "Import First", "price": 1, "category_id": 1}).encode(),
+        b'{"name": "Import \xff\xfe", "price": 1, "category_id": 1}',
+        json.dumps({"name": "Import Last", "price": 1, "category_id": 1}).encode()
+    ])
+    response = client.post("/products/import", content=body)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["imported"], report["failed"]) == (2, 1)
+    assert report["errors"][0]["line"] == 2
+    assert "UTF-8" in report["errors"][0]["error"]
+
+def test_csv_quoted_fields_may_span_lines(client, catalog, db, imported):
+    imported += ["Two\nLines", "Plain"]
+    body = (
+        b'name,price,category_id,attributes\n'
+        b'"Two\nLines",2,1,"{""color"": ""Red""}"\n'
+        b'\n'
+        b'Plain,3,1,\n'
+        b'"Unclosed,4,1,\n'
+    )
+    report = client.post("/products/import", params={"format": "csv"}, content=body).json()
+    assert (report["received"], report["imported"]) == (3, 2)
+    assert report["errors"] == [{"line": 6, "error": "unparseable row: unterminated quoted field"}]
+    assert db.query(Product).filter(Product.name == "Two\nLines").one().attr_color == "red"
@@ -0,0 +1,103 @@
+import pytest
+from cache import response_cache
+from Products.crud import facet_cache
+from Products.models import Product
+from Products.search import product_search_index
+
+
+def get_page(client, statements, **params):
+    # A cached body would skip the database entirely
+    response_cache.invalidate("products:list")
+    statements.clear()
+    response = client.get("/products/", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.mark.parametrize("per_page", [5, 20, 50])
+@pytest.mark.parametrize("sort_by", ["created_at", "price", "rating"])
+def test_page_is_one_select_whatever_its_size(client, catalog, statements, per_page, sort_by):
+    body = get_page(client, statements, per_page=per_page, sort_by=sort_by, count="none")
+    assert len(body["products"]) == per_page
+    assert len(statements) == 1
+
+@pytest.mark.parametrize("per_page", [5, 50])
+def test_exact_total_adds_one_count_query(client, catalog, statements, per_page):
+    body = get_page(client, statements, per_page=per_page, count="exact")
+    assert body["total"] == len(catalog)
+    assert len(statements) == 2
+
+@pytest.mark.parametrize("per_page", [7, 25])
+def test_cursor_pages_are_one_select_each(client, catalog, statements, per_page):
+    seen = []
+    cursor = None
+    while True:
+        params = {"per_page": per_page, "sort_by": "price", "sort_dir": "asc", "count": "none"}
+        if cursor:
+            params["cursor"] = cursor
+        body = get_page(client, statements, **params)
+        assert len(statements) == 1
+        seen += [product["id"] for product in body["products"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(catalog)
+
+def test_summary_fields_come_from_the_projection(client, catalog, statements):
+    body = get_page(client, statements, per_page=5, count="none")
+    assert set(body["products"][0]) == {"id", "name", "price", "brand", "stock_quantity", "category_name", "rating"}
+
+@pytest.mark.parametrize("sort_dir", ["desc", "asc"])
+def test_rating_cursor_pages_cover_unrated_products(client, catalog, statements, db, sort_dir):
+    edited = {product_id: db.get(Product, product_id) for product_id in catalog[:3]}
+    originals = {product_id: product.attributes for product_id, product in edited.items()}
+    for product, rating in zip(edited.values(), [None, None, 0]):
+        product.attributes = {"rating": rating}
+    db.commit()
+    try:
+        seen, ratings, cursor = [], [], None
+        while True:
+            params = {"per_page": 7, "sort_by": "rating", "sort_dir": sort_dir, "count": "none"}
+            if cursor:
+                params["cursor"] = cursor
+            body = get_page(client, statements, **params)
+            seen += [product["id"] for product in body["products"]]
+            ratings += [product["rating"] for product in body["products"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+        assert sorted(seen) == sorted(catalog)
+        # A missing rating sorts below every rating; a genuine 0 stays 0
+        keys = [-1 if rating is None else rating for rating in ratings]
+        assert keys == sorted(keys, reverse=sort_dir == "desc")
+        assert ratings[seen.index(catalog[2])] == 0
+        assert ratings.count(None) == 2
+    finally:
+        for product_id, product in edited.items():
+            product.attributes = originals[product_id]
+        db.commit()
+
+@pytest.mark.parametrize("sort_by,sort_dir", [("price", "asc"), ("price", "desc"), ("created_at", "desc"), ("name", "asc")])
+def test_sorted_search_covers_matches_past_the_id_list_cap(client, catalog, statements, monkeypatch, sort_by, sort_dir):
+    # The last search token matches as a prefix, so one letter matches many products
+    term = max("abcdefghijklmnopqrstuvwxyz", key=lambda letter: len(product_search_index.search(letter)))
+    params = {"search": term, "per_page": 5, "page": 2, "sort_by": sort_by, "sort_dir": sort_dir, "count": "exact"}
+    expected = get_page(client, statements, **params)
+    assert expected["total"] > 3 * 4
+
+    # Every query now takes 4 ranked ids, so the page is merged from several sorted queries
+    monkeypatch.setattr("Products.crud.MAX_SEARCH_RESULTS", 4)
+    body = get_page(client, statements, **params)
+    assert body["total"] == expected["total"] and body["total_exact"]
+    assert [product["id"] for product in body["products"]] == [product["id"] for product in expected["products"]]
+
+def test_search_facets_cover_matches_past_the_id_list_cap(client, catalog, monkeypatch):
+    def facets():
+        facet_cache.clear()
+        response = client.get("/products/facets", params={"search": "s"})
+        assert response.status_code == 200
+        return response.json()
+
+    expected = facets()
+    monkeypatch.setattr("Products.crud.MAX_SEARCH_RESULTS", 4)
+    assert facets() == expected
@@ -0,0 +1,24 @@
+from sqlalchemy import select, update
+from Products.crud import sync_promoted_attributes
+from Products.models import Category, Product
+
+
+def test_backfill_writes_only_rows_that_disagree_with_their_json(catalog, db):
+    category_id = db.scalar(select(Category.id).limit(1))
+    unrated = Product(name="Unrated", price=5, brand="Acme", category_id=category_id, attributes={"color": "Red"})
+    stale = Product(name="Stale", price=5, brand="Acme", category_id=category_id, attributes={"material": "Oak", "rating": 0})
+    db.add_all([unrated, stale])
+    db.commit()
+    # As if written before the columns were promoted
+    db.execute(update(Product).where(Product.id == stale.id).values(attr_material=None, attr_rating=None))
+    db.commit()
+    try:
+        assert sync_promoted_attributes(db) == 1
+        assert sync_promoted_attributes(db) == 0
+        db.expire_all()
+        assert (stale.attr_material, stale.attr_rating) == ("oak", 0)
+        assert (unrated.attr_color, unrated.attr_rating, unrated.version) == ("red", None, 1)
+    finally:
+        db.delete(unrated)
+        db.delete(stale)
+        db.commit()
@@ -0,0 +1,17 @@
+from Products.models import Product
+
+
+def test_price_list_reports_undecodable_lines(client, catalog, db):
+    product = db.get(Product, catalog[0])
+    original = float(product.price)
+    body = f"product_id,price\n{product.id},12.34\n\xff,1\n".encode("latin-1")
+    try:
+        response = client.post("/products/update-prices/csv", content=body)
+        assert response.status_code == 200
+        result = response.json()
+        assert result["updated"] == 1
+        assert len(result["failed"]) == 1 and result["failed"][0].startswith("line 3: not valid UTF-8")
+        db.expire_all()
+        assert float(db.get(Product, product.id).price) == 12.34
+    finally:
+        client.post("/products/update-prices/csv", content=f"{product.id},{original}\n".encode())
@@ -0,0 +1,74 @@
+"""Concurrent reservations of a product's last units must never oversell"""
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+import database
+from Products.crud import reserve_products, reserve_stock
+from Products.models import Category, Inventory, Product, StockMovement
+
+THREADS = 24
+
+
+@pytest.fixture
+def last_units(db):
+    """A product with 5 units left; its id"""
+    product = Product(name="Last Units", price=10, brand="Acme", category_id=db.scalar(select(Category.id).limit(1)))
+    db.add(product)
+    db.flush()
+    db.add(Inventory(product_id=product.id, quantity_available=5, quantity_reserve=0))
+    db.commit()
+    yield product.id
+    db.query(StockMovement).filter(StockMovement.product_id == product.id).delete()
+    db.query(Inventory).filter(Inventory.product_id == product.id).delete()
+    db.query(Product).filter(Product.id == product.id).delete()
+    db.commit()
+
+def reserve_concurrently(reserve):
+    """Run reserve(session) on THREADS threads released at once; the number that succeeded"""
+    barrier = threading.Barrier(THREADS)
+    outcomes = []
+
+    def worker():
+        session = database.SessionLocal()
+        try:
+            barrier.wait()
+            outcomes.append(reserve(session))
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(outcomes) == THREADS
+    return outcomes.count(True)
+
+def assert_no_oversell(db, product_id, succeeded, quantity):
+    inventory = db.scalars(select(Inventory).where(Inventory.product_id == product_id)).one()
+    assert succeeded == 5 // quantity
+    assert inventory.quantity_available == 5 - succeeded * quantity >= 0
+    assert inventory.quantity_reserve == succeeded * quantity
+    movements = db.execute(
+        select(func.count(), func.sum(StockMovement.change)).where(StockMovement.product_id == product_id)
+    ).one()
+    assert tuple(movements) == (succeeded, -succeeded * quantity)
+
+
+@pytest.mark.parametrize("quantity", [1, 2])
+def test_reserve_stock_never_oversells(catalog, db, last_units, quantity):
+    succeeded = reserve_concurrently(lambda session: reserve_stock(session, last_units, quantity))
+    assert_no_oversell(db, last_units, succeeded, quantity)
+
+@pytest.mark.parametrize("quantity", [1, 2])
+def test_reserve_products_never_oversells(catalog, db, last_units, quantity):
+    def reserve(session):
+        try:
+            reserve_products({"product_id": last_units, "quantity": quantity}, db=session)
+            return True
+        except HTTPException:
+            return False
+
+    succeeded = reserve_concurrently(reserve)
+    assert_no_oversell(db, last_units, succeeded, quantity)
@@ -0,0 +1,26 @@
+import pytest
+
+
+def register(client, name):
+    user = client.post("/users/register", json={
+        "email": f"{name}@example.com", "username": name, "password": "secret-pw",
+        "gender": "other", "age": 30, "phone_number": "555-0100", "nationality": "Testland"
+    })
+    assert user.status_code == 200
+    token = client.post("/users/token", data={"username": f"{name}@example.com", "password": "secret-pw"}).json()["access_token"]
+    return user.json()["id"], {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture(scope="module")
+def users(client):
+    return register(client, "deactivation-a"), register(client, "deactivation-b")
+
+
+def test_users_cannot_deactivate_someone_else(client, users):
+    (_, headers), (other_id, other_headers) = users
+    assert client.post(f"/users/{other_id}/deactivate", headers=headers).status_code == 403
+    assert client.get(f"/users/{other_id}", headers=other_headers).status_code == 200
+
+def test_deactivating_yourself_revokes_your_token(client, users):
+    (user_id, headers), _ = users
+    assert client.post(f"/users/{user_id}/deactivate", headers=headers).status_code == 200
+    assert client.get(f"/users/{user_id}", headers=headers).status_code == 403
@@ -1,21 +1,31 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from auth import decode_token
-from Users.crud import get_user_by_email
-from database import get_db
+from jose import JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth import Principal, decode_token, principal_cache
+from Users.crud import get_user_by_email_async
+from database import get_async_db
+import time
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
     try:
         payload = decode_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = get_user_by_email(db, email)
+        user = await get_user_by_email_async(db, email)
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
-        return user
+        # Deactivation drops cached principals, so only active users are ever cached
+        if user.is_active is False:
+            raise HTTPException(status_code=403, detail="Inactive user")
+        principal = Principal(id=user.id, email=user.email, username=user.username, is_active=True)
+        principal_cache.set(token, principal, ttl=payload["exp"] - time.time())
+        return principal
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not validate credentials")